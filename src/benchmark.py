@@ -0,0 +1,224 @@
+from src.game import Game
+
+import numpy as np
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import time
+
+# sizes of the Hash Code 2018 pizzas: rows, columns, L, H
+PIZZAS = {
+    'example': (3, 5, 1, 6),
+    'small':   (6, 7, 1, 5),
+    'medium':  (200, 250, 4, 12),
+    'big':     (1000, 1000, 6, 14),
+}
+
+def generate_pizza(name, seed=0):
+    '''
+    Return pizza config with the size of the Hash Code pizza, the same for the same seed.
+    '''
+
+    r, c, l, h = PIZZAS[name]
+    random = np.random.RandomState(seed)
+    pizza_lines = [''.join(line) for line in random.choice(['T','M'], (r,c)).tolist()]
+    return { 'pizza_lines': pizza_lines, 'r': r, 'c': c, 'l': l, 'h': h }
+
+def random_actions(steps, seed=0):
+    random = np.random.RandomState(seed)
+    return [['right', 'down', 'left', 'up', 'toggle'][i] for i in random.randint(0, 5, steps)]
+
+def scripted_actions(pizza_config, steps):
+    '''
+    Actions that go through the pizza row by row and try to cut a slice of two
+    columns and two rows at every second cell, so most steps are increases.
+    After the last row the cursor goes back to the top left corner and it starts
+    again, until there are enough steps.
+    '''
+
+    actions = []
+    for ri in range(0, pizza_config['r'], 2):
+        for ci in range(0, pizza_config['c'], 2):
+            actions += ['toggle', 'right', 'down', 'toggle']
+            if ci+2 < pizza_config['c']:
+                actions += ['right', 'right']
+        actions += ['left'] * ci + ['down', 'down']
+    actions += ['up'] * pizza_config['r']
+    return (actions * (steps // len(actions) + 1))[:steps]
+
+def time_steps(pizza_config, observation, actions):
+    '''
+    Play the actions and return seconds spent in Game.step. When the game is
+    over it is started again, which is not timed.
+    '''
+
+    game = Game({ 'observation': observation })
+    game.init(pizza_config)
+    seconds = 0.0
+    start = time.perf_counter()
+    for action in actions:
+        game.step(action)
+        if game.env['done']:
+            seconds += time.perf_counter() - start
+            game.init(pizza_config)
+            start = time.perf_counter()
+    return seconds + time.perf_counter() - start
+
+def best_time(fn, repeats):
+    times = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+class Benchmark:
+    '''
+    Times the game on generated pizzas. Every case is run a few times and the
+    best time is kept, results are keyed by "<pizza>/<case>".
+    '''
+
+    # number of steps for each pizza and observation, a case is skipped without steps
+    steps = {
+        'example': { 'dict': 10000, 'numpy': 10000 },
+        'small':   { 'dict': 10000, 'numpy': 10000 },
+        'medium':  { 'dict': 200,   'numpy': 10000 },
+        'big':     { 'dict': 0,     'numpy': 10000 },
+    }
+
+    def __init__(self, pizzas=None, repeats=3, scale=1.0, seed=0):
+        self.pizzas = list(PIZZAS) if pizzas is None else pizzas
+        self.repeats = repeats
+        self.scale = scale
+        self.seed = seed
+        self.results = {}
+        self.memory = {}
+
+    def add(self, name, seconds, count=1):
+        self.results[name] = {
+            'seconds': seconds,
+            'count': count,
+            'per_second': count / seconds if seconds > 0 else float('inf'),
+        }
+
+    def play(self, pizza_config, actions):
+        game = Game({ 'observation': 'numpy' })
+        game.init(pizza_config)
+        for action in actions:
+            game.step(action)
+            if game.env['done']:
+                break
+        return game
+
+    def run_pizza(self, name):
+        pizza_config = generate_pizza(name, self.seed)
+        game = Game({})
+        self.add(name + '/init', best_time(lambda: game.init(pizza_config), self.repeats))
+
+        for observation in ['dict', 'numpy']:
+            steps = int(self.steps[name][observation] * self.scale)
+            if steps == 0:
+                continue
+            for script, actions in [
+                    ('random', random_actions(steps, self.seed)),
+                    ('scripted', scripted_actions(pizza_config, steps))]:
+                seconds = min(time_steps(pizza_config, observation, actions) for i in range(self.repeats))
+                self.add('{}/step_{}_{}'.format(name, script, observation), seconds, len(actions))
+
+        game = self.play(pizza_config, scripted_actions(pizza_config, int(10000 * self.scale)))
+        self.memory[name] = game.google_engineer.pizza.memory()
+        env = game.full_env()
+        with open(os.devnull, 'w') as f, contextlib.redirect_stdout(f):
+            self.add(name + '/print_from',
+                best_time(lambda: game.serve_pizza.print_from(env), self.repeats))
+        self.add(name + '/json_dumps',
+            best_time(lambda: json.dumps(env, separators=(',',':')), self.repeats))
+
+    def run(self, log=None):
+        for name in self.pizzas:
+            self.run_pizza(name)
+            if log is not None:
+                for case, result in self.results.items():
+                    if case.startswith(name + '/'):
+                        log(case, result)
+        return self.results
+
+    def report(self):
+        return {
+            'commit': git_commit(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'repeats': self.repeats,
+            'scale': self.scale,
+            'seed': self.seed,
+            'results': self.results,
+            'memory': self.memory,
+        }
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL, cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(baseline, results, threshold=0.1):
+    '''
+    Return rows (case, baseline seconds, seconds, ratio) for the cases in both
+    results and the list of cases that got slower by more than the threshold.
+    '''
+
+    rows, regressions = [], []
+    for case, result in results.items():
+        if case not in baseline:
+            continue
+        before, after = baseline[case]['seconds'], result['seconds']
+        ratio = after / before if before > 0 else float('inf')
+        rows.append((case, before, after, ratio))
+        if ratio > 1 + threshold:
+            regressions.append(case)
+    return rows, regressions
+
+if __name__ == '__main__':
+    import argparse, sys
+    parser = argparse.ArgumentParser(description='Benchmark the game on generated pizzas of Hash Code sizes')
+    parser.add_argument('--pizzas', nargs='+', choices=list(PIZZAS), default=list(PIZZAS),
+        help='pizzas to run, all by default')
+    parser.add_argument('--repeats', type=int, default=3, help='times to run each case, the best time is kept')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplier of the number of steps')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the pizzas and random actions')
+    parser.add_argument('--output', default=None, help='a path where to store results as json')
+    parser.add_argument('--compare', default=None, help='results saved with --output to compare with')
+    parser.add_argument('--threshold', type=float, default=0.1, help='slowdown ratio above which ' + \
+        'a case is reported as a regression with --compare')
+    args = parser.parse_args()
+
+    benchmark = Benchmark(args.pizzas, repeats=args.repeats, scale=args.scale, seed=args.seed)
+    benchmark.run(lambda case, result: print('{:32} {:10.4f}s {:14.1f}/s'.format(
+        case, result['seconds'], result['per_second'])))
+
+    print()
+    print('Memory of a game:')
+    for name, memory in benchmark.memory.items():
+        print('{:32} {:10.1f}KB  ({})'.format(name, sum(memory.values()) / 1024,
+            ', '.join('{}: {:.1f}KB'.format(array, nbytes / 1024) for array, nbytes in memory.items())))
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(benchmark.report(), f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows, regressions = compare(baseline['results'], benchmark.results, args.threshold)
+        print()
+        print('Compared with {} ({}):'.format(args.compare, baseline.get('commit')))
+        for case, before, after, ratio in rows:
+            print('{:32} {:10.4f}s {:10.4f}s {:8.2f}x{}'.format(
+                case, before, after, ratio, '  slower' if case in regressions else ''))
+        if len(regressions) > 0:
+            sys.exit(1)
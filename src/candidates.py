@@ -0,0 +1,111 @@
+import numpy as np
+import hashlib
+import os
+
+VERSION = 1
+
+CACHE_DIR = os.environ.get('PIZZA_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'pizza_cutting_turbo_simulator'))
+
+class CandidateIndex:
+    '''
+    Valid shapes of slices (not more than H cells, at least L of each ingredient)
+    for every cell of the pizza, where the cell is the top left corner of the slice.
+
+    Shapes (height, width) are sorted by area from the biggest one, and the shapes
+    of cell i = r*C+c are stored in CSR form as indices[indptr[i]:indptr[i+1]],
+    in the same order as the shapes.
+    '''
+
+    def __init__(self, shape, shapes, indptr, indices):
+        self.r, self.c = shape
+        self.shapes = shapes
+        self.indptr = indptr
+        self.indices = indices
+
+    @classmethod
+    def build(cls, ingredients, l, h):
+        r, c = ingredients.shape
+        shapes = [(height, width)
+            for height in range(1, min(h, r)+1)
+            for width in range(1, min(h//height, c)+1)
+            if height*width >= l*ingredients.total_unique]
+        shapes.sort(key=lambda shape: (-shape[0]*shape[1], shape[0]))
+
+        p = ingredients._padded_from_origin
+        cells, shape_indices, used = [], [], []
+        for height, width in shapes:
+            counts = p[height:,width:] - p[:-height,width:] - p[height:,:-width] + p[:-height,:-width]
+            rows, columns = np.nonzero(counts.min(axis=2) >= l)
+            if len(rows) > 0:
+                cells.append(rows*c+columns)
+                shape_indices.append(np.full(len(rows), len(used), dtype=np.uint16))
+                used.append((height, width))
+
+        cells = np.concatenate(cells) if len(cells) > 0 else np.zeros(0, dtype=np.int64)
+        shape_indices = np.concatenate(shape_indices) if len(shape_indices) > 0 else \
+            np.zeros(0, dtype=np.uint16)
+        order = np.argsort(cells, kind='stable')
+
+        indptr = np.zeros(r*c+1, dtype=np.int64)
+        np.cumsum(np.bincount(cells, minlength=r*c), out=indptr[1:])
+        return cls((r, c), np.array(used, dtype=np.int32).reshape((-1,2)), indptr, shape_indices[order])
+
+    @classmethod
+    def load(cls, ingredients, l, h, cache_dir=CACHE_DIR):
+        '''
+        Return the index from the cache or build it and save into the cache.
+        The index is not cached if cache_dir is None.
+        '''
+
+        if cache_dir is None:
+            return cls.build(ingredients, l, h)
+
+        path = os.path.join(cache_dir, '{}.npz'.format(cache_key(ingredients, l, h)))
+        if os.path.exists(path):
+            with np.load(path) as f:
+                return cls(ingredients.shape, f['shapes'], f['indptr'], f['indices'])
+
+        index = cls.build(ingredients, l, h)
+        index.save(path)
+        return index
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # write next to the file and rename, so a half written index is never read
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, shapes=self.shapes, indptr=self.indptr, indices=self.indices)
+        os.replace(tmp_path, path)
+
+    def __len__(self):
+        '''
+        Number of valid rectangles on the pizza.
+        '''
+
+        return len(self.indices)
+
+    def shapes_at(self, r, c):
+        '''
+        Return indices of the valid shapes with the top left corner at (r,c).
+        '''
+
+        i = r*self.c+c
+        return self.indices[self.indptr[i]:self.indptr[i+1]]
+
+    def rectangles_at(self, r, c):
+        '''
+        Return bounds (r0, c0, r1, c1) of the valid slices with the top left corner at (r,c).
+        '''
+
+        return [(r, c, r+height-1, c+width-1)
+            for height, width in self.shapes[self.shapes_at(r, c)].tolist()]
+
+def cache_key(ingredients, l, h):
+    '''
+    Hash of the pizza lines together with L and H.
+    '''
+
+    key = hashlib.sha1('{} {} {}\n'.format(VERSION, l, h).encode())
+    key.update('\n'.join(ingredients.as_lines()).encode())
+    return key.hexdigest()
@@ -0,0 +1,219 @@
+from src.google_engineer import ACTIONS
+from src.pool import map_unordered
+from src.trajectory import TrajectoryReader
+
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import json
+import os
+
+def find_games(paths):
+    '''
+    Return folders with recorded games among the paths and their subfolders. A game
+    is a folder with "trajectory.bin" or with "<step>_env.json" files.
+    '''
+
+    games = []
+    for path in paths:
+        for folder, _, filenames in os.walk(path):
+            if 'trajectory.bin' in filenames or '0_env.json' in filenames:
+                games.append(folder)
+    return sorted(games)
+
+# slices maps kept for each game, the others are rebuilt from the nearest one
+KEYFRAMES = 16
+
+def load_game(folder):
+    '''
+    Read a recorded game into arrays. Cursor and slice mode have a row for every
+    environment, so transition t goes from row t to row t+1, while actions,
+    rewards, done and rects of the cut slices (-1 if none) have a row for every
+    transition. Slices maps are kept only for a few steps, see slices_map_of.
+    '''
+
+    if os.path.exists(os.path.join(folder, 'trajectory.bin')):
+        trajectory = TrajectoryReader(os.path.join(folder, 'trajectory.bin'))
+        records = trajectory.records
+        game = {
+            'ingredients_map': trajectory.ingredients._map.astype(np.int32),
+            'rect': np.array(records['rect'], dtype=np.int32),
+            'cursor_position': np.concatenate([[(0,0)], records['cursor']]).astype(np.int32),
+            'slice_mode': np.concatenate([[False], records['slice_mode'].astype(bool)]),
+            'action': np.array(records['action'], dtype=np.uint8),
+            'reward': np.array(records['reward'], dtype=np.float32),
+            'done': np.array(records['done'], dtype=bool),
+        }
+        return _with_keyframes(game)
+
+    envs = _json_envs(folder)
+    rects, cursor_positions, slice_modes = [], [], []
+    actions, rewards, dones = [], [], []
+    previous_slices_map = None
+    for env in envs:
+        slices_map = np.array(env['state']['slices_map'], dtype=np.int32)
+        if previous_slices_map is None:
+            ingredients_map = np.array(env['state']['ingredients_map'], dtype=np.int32)
+        else:
+            actions.append(ACTIONS.index(env['information']['action']))
+            rewards.append(env['reward'])
+            dones.append(env['done'])
+            rects.append(_cut_rect(previous_slices_map, slices_map))
+        previous_slices_map = slices_map
+        cursor_positions.append(env['state']['cursor_position'])
+        slice_modes.append(env['state']['slice_mode'])
+
+    game = {
+        'ingredients_map': ingredients_map,
+        'rect': np.array(rects, dtype=np.int32).reshape((-1,4)),
+        'cursor_position': np.array(cursor_positions, dtype=np.int32).reshape((-1,2)),
+        'slice_mode': np.array(slice_modes, dtype=bool),
+        'action': np.array(actions, dtype=np.uint8),
+        'reward': np.array(rewards, dtype=np.float32),
+        'done': np.array(dones, dtype=bool),
+    }
+    return _with_keyframes(game)
+
+def slices_map_of(game, t):
+    '''
+    Return slices map of environment t of a loaded game: the nearest kept map
+    before it with the slices cut since then.
+    '''
+
+    i = np.searchsorted(game['keyframe_step'], t, side='right') - 1
+    slices_map = game['keyframe'][i].copy()
+    _cut(slices_map, game['rect'][game['keyframe_step'][i]:t])
+    return slices_map
+
+def _with_keyframes(game):
+    # a map after every len(cuts)/KEYFRAMES cuts, so at most that many are cut again
+    cuts = np.flatnonzero(game['rect'][:,0] != -1)
+    steps = [0] + (cuts[::max(1, -(-len(cuts) // KEYFRAMES))] + 1).tolist()
+    slices_map = np.full(game['ingredients_map'].shape, -1, dtype=np.int32)
+    keyframes = [slices_map.copy()]
+    for previous_step, step in zip(steps, steps[1:]):
+        _cut(slices_map, game['rect'][previous_step:step])
+        keyframes.append(slices_map.copy())
+    game['keyframe_step'] = np.array(steps)
+    game['keyframe'] = np.array(keyframes)
+    return game
+
+def _cut(slices_map, rects):
+    for r0, c0, r1, c1 in rects.tolist():
+        if r0 != -1:
+            slices_map[r0:r1+1, c0:c1+1] = r0*slices_map.shape[1]+c0
+
+def _cut_rect(slices_map, next_slices_map):
+    changed = np.flatnonzero(slices_map != next_slices_map)
+    if len(changed) == 0:
+        return (-1,-1,-1,-1)
+    rows, columns = np.nonzero(next_slices_map == next_slices_map.flat[changed[0]])
+    return (rows.min(), columns.min(), rows.max(), columns.max())
+
+def _json_envs(folder):
+    step = 0
+    while os.path.exists(os.path.join(folder, '{}_env.json'.format(step))):
+        with open(os.path.join(folder, '{}_env.json'.format(step))) as f:
+            yield json.load(f)
+        step += 1
+
+def _pad(arrays, fill):
+    shape = np.max([array.shape for array in arrays], axis=0)
+    batch = np.full((len(arrays), *shape), fill, dtype=arrays[0].dtype)
+    for i, array in enumerate(arrays):
+        batch[(i, *[slice(0, n) for n in array.shape])] = array
+    return batch
+
+class Dataset:
+    '''
+    Streams batches of transitions (state, action, reward, next_state, done) from
+    folders with recorded games.
+
+    Games are parsed in a process pool with a bounded number of games in flight,
+    and their transitions go through a shuffle buffer of a fixed size, so memory
+    does not depend on the number of games. The buffer keeps only the game and
+    the step of a transition, and its slices maps are rebuilt when it leaves the
+    buffer. Maps of pizzas of different sizes are
+    padded with -1 to the biggest pizza in the batch.
+    '''
+
+    def __init__(self, paths, batch_size=32, shuffle_buffer=10000, workers=None, seed=None):
+        self.games = find_games(paths)
+        self.batch_size = batch_size
+        self.shuffle_buffer = shuffle_buffer
+        self.workers = os.cpu_count() if workers is None else workers
+        self.seed = seed
+
+    def loaded_games(self, games):
+        if self.workers == 0:
+            for game in games:
+                yield load_game(game)
+            return
+
+        with ProcessPoolExecutor(self.workers) as executor:
+            yield from map_unordered(executor, load_game, games, 2*self.workers)
+
+    def transitions(self):
+        '''
+        Yield transitions in the order of the shuffle buffer.
+        '''
+
+        random = np.random.RandomState(self.seed)
+        games = [self.games[i] for i in random.permutation(len(self.games))]
+
+        buffer = []
+        for game in self.loaded_games(games):
+            for t in range(len(game['action'])):
+                transition = (game, t)
+                if len(buffer) < self.shuffle_buffer:
+                    buffer.append(transition)
+                    continue
+                i = random.randint(len(buffer))
+                buffer[i], transition = transition, buffer[i]
+                yield self._transition(*transition)
+
+        for i in random.permutation(len(buffer)):
+            yield self._transition(*buffer[i])
+
+    def _transition(self, game, t):
+        return (
+            self._state(game, t),
+            game['action'][t],
+            game['reward'][t],
+            self._state(game, t+1),
+            game['done'][t])
+
+    def _state(self, game, t):
+        return {
+            'ingredients_map': game['ingredients_map'],
+            'slices_map': slices_map_of(game, t),
+            'cursor_position': game['cursor_position'][t],
+            'slice_mode': game['slice_mode'][t],
+        }
+
+    def batch(self, transitions):
+        states, actions, rewards, next_states, dones = zip(*transitions)
+        return {
+            'state': self._batch_states(states),
+            'action': np.array(actions),
+            'reward': np.array(rewards),
+            'next_state': self._batch_states(next_states),
+            'done': np.array(dones),
+        }
+
+    def _batch_states(self, states):
+        return {
+            'ingredients_map': _pad([state['ingredients_map'] for state in states], -1),
+            'slices_map': _pad([state['slices_map'] for state in states], -1),
+            'cursor_position': np.array([state['cursor_position'] for state in states]),
+            'slice_mode': np.array([state['slice_mode'] for state in states]),
+        }
+
+    def __iter__(self):
+        transitions = []
+        for transition in self.transitions():
+            transitions.append(transition)
+            if len(transitions) == self.batch_size:
+                yield self.batch(transitions)
+                transitions = []
+        if len(transitions) > 0:
+            yield self.batch(transitions)
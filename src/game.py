@@ -1,9 +1,95 @@
-from src.google_engineer import GoogleEngineer
+from src.google_engineer import GoogleEngineer, ActionNotFoundException, ACTIONS
+from src.ingredients import Ingredients
 from src.pizza import Pizza
+from src.profiler import profiler
+from src.trajectory import TrajectoryWriter
 
 import numpy as np
 import json
 import os
+import sys
+import time
+
+def load_pizza_config(source):
+    '''
+    Read pizza config from a file in the format of Hash Code input at once.
+    Source is a path or a binary file, for example sys.stdin.buffer. The config
+    has ingredients decoded from the bytes (see Ingredients.from_bytes) instead
+    of pizza lines, so it is ready for Game.init or GoogleEngineer.
+    '''
+
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            data = f.read()
+    else:
+        data = source.read()
+
+    config_line, _, pizza = data.partition(b'\n')
+    r, c, l, h = [int(n) for n in config_line.split()]
+    return { 'ingredients': Ingredients.from_bytes(pizza, r, c), 'r': r, 'c': c, 'l': l, 'h': h }
+
+def write_slices(f, slices):
+    '''
+    Write slices (r0, c0, r1, c1) in the format of Hash Code output.
+    '''
+
+    f.write('{}\n'.format(len(slices)))
+    for slice in slices:
+        f.write('{} {} {} {}\n'.format(*slice))
+
+def read_actions(f, chunk_size=1<<16):
+    '''
+    Yield lists of actions read from the file in chunks of chunk_size characters.
+    Actions are separated by any whitespace, usually one per line.
+    '''
+
+    rest = ''
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        actions = (rest + chunk).split()
+        # the last action may continue in the next chunk
+        rest = '' if chunk[-1].isspace() else actions.pop()
+        yield actions
+    if rest:
+        yield [rest]
+
+def play_batch(game, f, trajectory=None, checkpoint_every=None, checkpoint=None):
+    '''
+    Play actions from the file without rendering until the game is over or the
+    actions run out. Every checkpoint_every steps checkpoint(game) is called.
+    Return seconds spent in each phase: reading actions, steps, recording into
+    the trajectory and checkpoints.
+    '''
+
+    times = { 'read': 0.0, 'step': 0.0, 'record': 0.0, 'checkpoint': 0.0 }
+    chunks = read_actions(f)
+    while not game.env['done']:
+        start = time.perf_counter()
+        actions = next(chunks, None)
+        times['read'] += time.perf_counter() - start
+        if actions is None:
+            break
+
+        for action in actions:
+            start = time.perf_counter()
+            game.step(action)
+            end = time.perf_counter()
+            times['step'] += end - start
+
+            if trajectory is not None:
+                trajectory.write(game)
+                start, end = end, time.perf_counter()
+                times['record'] += end - start
+
+            if checkpoint_every and game.step_index % checkpoint_every == 0:
+                checkpoint(game)
+                times['checkpoint'] += time.perf_counter() - end
+
+            if game.env['done']:
+                break
+    return times
 
 class StandardInput:
     def next(self):
@@ -57,14 +143,8 @@ class ServePizza:
     def initialize_pizza(self, unique_ingredients, ingredients_map):
         # ingredients
         self.pizza = np.full((self.r,self.c), ' ')
-        for ri in range(self.r):
-            for ci in range(self.c):
-                if (ri%self.r_scale==2 and \
-                    ci%self.c_scale==4):
-
-                    self.pizza[ri][ci] = unique_ingredients[ingredients_map
-                        [(ri-2)//self.r_scale]
-                        [(ci-4)//self.c_scale]]
+        self.pizza[2::self.r_scale, 4::self.c_scale] = \
+            np.array(unique_ingredients)[np.asarray(ingredients_map)]
 
         # outline pizza
         self.pizza[0:self.r:self.r-1, 1:self.c-1] = '-'
@@ -95,10 +175,10 @@ class ServePizza:
                 self.r_scale*r0+2: self.r_scale*(r1+1), # for every row in the slice
                 self.c_scale*c0+2: self.c_scale*(c1+1)+1: self.c_scale*(c1-c0+1)-2, # for left, right cuts
                 ] = '|'
-            for ri in range(self.r_scale*r0+2, self.r_scale*(r1+1)):
-                for ci in range(self.c_scale*c0+4, self.c_scale*(c1+1), 3):
-                    if self.pizza[ri,ci] == ' ':
-                        self.pizza[ri,ci] = '`'
+            inside = self.pizza[
+                self.r_scale*r0+2: self.r_scale*(r1+1),
+                self.c_scale*c0+4: self.c_scale*(c1+1): 3]
+            inside[inside == ' '] = '`'
 
         for slice in slices:
             r0,c0,r1,c1 = slice
@@ -132,6 +212,146 @@ class ServePizza:
         for line in self.pizza:
             print('    {}'.format(''.join(line)))
 
+class LiveServePizza(ServePizza):
+    '''
+    Draws the game in place with ANSI escape codes instead of printing the whole
+    pizza after every step. The pizza is drawn once, then only the cells of the
+    slice cut by the last action and of the cursor are drawn again. Frames come
+    at most fps times per second, changes in between are drawn with the next
+    frame or by flush, which is called before waiting for the next action. If
+    the pizza does not fit the terminal, the visible part of it follows the
+    cursor.
+    '''
+
+    top = 3
+
+    def __init__(self, fps=30):
+        self.min_frame_time = 1/fps if fps > 0 else 0
+        self.last_frame_time = float('-inf')
+        self.viewport = None
+        self.changed = []
+        self.shown_cursor = None
+        self.pending = False
+
+    def start(self, game):
+        import shutil
+        env = game.full_env()
+        ingredients_map = env['state']['ingredients_map']
+        self.rows, self.columns = len(ingredients_map), len(ingredients_map[0])
+        self.r, self.c = self.r_scale*self.rows+2, self.c_scale*self.columns+3
+
+        self.initialize_pizza(env['information']['unique_ingredients'], ingredients_map)
+        self.base = self.pizza.copy()
+        self.cut(self.find_slices(env['state']['slices_map']))
+
+        terminal = shutil.get_terminal_size()
+        self.height = max(1, min(self.rows, (terminal.lines-self.top-3) // self.r_scale))
+        self.width = max(1, min(self.columns, (terminal.columns-7) // self.c_scale))
+        self.draw(game, force=True)
+
+    def update(self, game):
+        changed_slice = game.google_engineer.changed_slice
+        if changed_slice is not None:
+            r0, c0, r1, c1 = changed_slice.as_tuple
+            rows = slice(self.r_scale*r0+1, self.r_scale*(r1+1)+1)
+            columns = slice(self.c_scale*c0+2, self.c_scale*(c1+1)+2)
+            self.pizza[rows, columns] = self.base[rows, columns]
+            self.cut([(r0, c0, r1, c1)])
+            self.changed.append((r0, c0, r1, c1))
+        self.pending = True
+        if time.time() - self.last_frame_time >= self.min_frame_time:
+            self.draw(game)
+
+    def flush(self, game):
+        '''
+        Draw the changes that were left for the next frame.
+        '''
+
+        if self.pending:
+            self.draw(game)
+
+    def close(self, game):
+        import sys
+        self.draw(game, force=True)
+        sys.stdout.write('\x1b[{};1H\n'.format(self.top + self.r_scale*self.height + 2))
+        sys.stdout.flush()
+
+    def follow(self, position):
+        '''
+        Move the visible part of the pizza, so that the cursor is inside. Return
+        True if it was moved.
+        '''
+
+        r, c = position
+        vr, vc = (0, 0) if self.viewport is None else self.viewport
+        vr = min(max(vr, r-self.height+1), r)
+        vc = min(max(vc, c-self.width+1), c)
+        moved = self.viewport != (vr, vc)
+        self.viewport = (vr, vc)
+        return moved
+
+    def draw(self, game, force=False):
+        import sys
+        self.last_frame_time = time.time()
+        self.pending = False
+
+        env = game.env
+        cursor = game.google_engineer.cursor_position
+        slice_mode = game.google_engineer.slice_mode
+
+        out = []
+        if self.follow(cursor) or force:
+            out.append('\x1b[2J')
+            self.changed = [(0, 0, self.rows-1, self.columns-1)]
+        elif self.shown_cursor is not None:
+            self.changed.append((*self.shown_cursor, *self.shown_cursor))
+        self.changed.append((*cursor, *cursor))
+
+        vr, vc = self.viewport
+        for r0, c0, r1, c1 in self.changed:
+            r0, c0 = max(r0, vr), max(c0, vc)
+            r1, c1 = min(r1, vr+self.height-1), min(c1, vc+self.width-1)
+            if r0 > r1 or c0 > c1:
+                continue
+            # cells next to the edge of the pizza are drawn with its outline
+            grid_r0 = self.r_scale*r0 + (0 if r0 == 0 else 1)
+            grid_r1 = self.r_scale*(r1+1) + (1 if r1 == self.rows-1 else 0)
+            grid_c0 = self.c_scale*c0 + (0 if c0 == 0 else 2)
+            grid_c1 = self.c_scale*(c1+1) + (2 if c1 == self.columns-1 else 1)
+            for grid_r in range(grid_r0, grid_r1+1):
+                line = self.pizza[grid_r, grid_c0:grid_c1+1].copy()
+                if grid_r == self.r_scale*cursor[0]+2 and grid_c0 <= self.c_scale*cursor[1]+3 <= grid_c1:
+                    line[self.c_scale*cursor[1]+3-grid_c0] = '<' if slice_mode else '['
+                    line[self.c_scale*cursor[1]+5-grid_c0] = '>' if slice_mode else ']'
+                out.append('\x1b[{};{}H{}'.format(
+                    self.top + grid_r - self.r_scale*vr,
+                    5 + grid_c0 - self.c_scale*vc,
+                    ''.join(line)))
+        self.changed = []
+        self.shown_cursor = cursor
+
+        information = env['information']
+        out.append('\x1b[1;1H\x1b[K  Step: {}  Score: {}  Last action: {}  Last reward: {}  Slice mode: {}'.format(
+            information['step'], information['score'], information['action'], env['reward'],
+            'on' if slice_mode else 'off'))
+        out.append('\x1b[2;1H\x1b[K  Cursor: ({},{})  Rows: {}-{} of {}  Columns: {}-{} of {}'.format(
+            *cursor, vr, vr+self.height-1, self.rows, vc, vc+self.width-1, self.columns))
+        # keep the typed actions below the pizza
+        out.append('\x1b[{};1H\x1b[K'.format(self.top + self.r_scale*self.height + 2))
+        sys.stdout.write(''.join(out))
+        sys.stdout.flush()
+
+
+def is_macro_action(action):
+    '''
+    Return True if the action is a sequence of four integers, as macro actions are.
+    '''
+
+    try:
+        return len(action) == 4 and all(isinstance(n, (int, np.integer)) and not isinstance(n, bool)
+            for n in action)
+    except TypeError:
+        return False
 
 class Game:
 
@@ -161,8 +381,24 @@ class Game:
 
     goodbye = '\nBon appetit !'
 
+    observations = ['dict', 'numpy', 'delta', 'window']
+
+    # in "macro" action mode an action is (r, c, height, width) of a slice to cut,
+    # see GoogleEngineer.place; information has no action mask in this mode, the
+    # mask is only for the actions of "step" mode
+    action_modes = ['step', 'macro']
+
     def __init__(self, args):
         self.max_steps = args.get('max_steps', float('inf'))
+        self.observation = args.get('observation', 'dict')
+        self.window_size = args.get('window_size', 11)
+        self.action_mode = args.get('action_mode', 'step')
+        if self.action_mode not in self.action_modes:
+            raise ValueError('Action mode \'{}\' is not one of {}.'.format(
+                self.action_mode, self.action_modes))
+        if self.observation not in self.observations:
+            raise ValueError('Observation \'{}\' is not one of {}.'.format(
+                self.observation, self.observations))
         self.env = None
         self.serve_pizza = ServePizza()
 
@@ -173,7 +409,7 @@ class Game:
         self.step_index = 0
 
         self.env = {
-            'state': self.google_engineer.state(),
+            'state': self.initial_state(),
             'reward': 0,
             'done': False,
             'information': {
@@ -181,18 +417,47 @@ class Game:
                 'action': 'none',
                 'unique_ingredients': self.unique_ingredients,
                 'score': 0,
+                'frontier': self.google_engineer.pizza.growable_frontier,
                 'slices': []}}
+        if self.action_mode == 'step':
+            self.env['information']['action_mask'] = self.google_engineer.action_mask().tolist()
         return self.env['state'], self.env['reward'], self.env['done'], self.env['information']
 
 
+    def check_action(self, action):
+        '''
+        Raise ActionNotFoundException if the action is not an action of the action
+        mode. Step checks the action before it is counted, so a wrong action does
+        not change the game.
+        '''
+
+        if self.action_mode == 'macro':
+            if not is_macro_action(action):
+                raise ActionNotFoundException('Action {!r} is not (r, c, height, width) of a slice.'.format(action))
+        elif not isinstance(action, str) or action not in ACTIONS:
+            raise ActionNotFoundException('Action \'{}\' is not recognised.'.format(action))
+
     def step(self, action):
+        self.check_action(action)
         self.step_index += 1
-        reward = self.google_engineer.do(action)
+        if profiler.enabled:
+            profiler.begin_step(self.step_index)
+            start = time.perf_counter()
+
+        if self.action_mode == 'macro':
+            reward = self.google_engineer.place(*action)
+        else:
+            reward = self.google_engineer.do(action)
         done = not self.google_engineer.pizza.can_increase_more() or self.step_index >= self.max_steps
-        slices = sorted(self.google_engineer.valid_slices, key=lambda s: s.as_tuple)
+        if profiler.enabled:
+            start = profiler.add('do', start)
+
+        state = self.step_state()
+        if profiler.enabled:
+            start = profiler.add('state', start)
 
         self.env = {
-            'state': self.google_engineer.state(),
+            'state': state,
             'reward': reward,
             'done': done,
             'information': {
@@ -200,31 +465,71 @@ class Game:
                 'action': action,
                 'unique_ingredients': self.unique_ingredients,
                 'score': self.google_engineer.score,
-                'slices': [slice.as_tuple for slice in slices]}}
+                'frontier': self.google_engineer.pizza.growable_frontier,
+                'slices': self.google_engineer.valid_slices.as_tuples()}}
+        if self.action_mode == 'step':
+            self.env['information']['action_mask'] = self.google_engineer.action_mask().tolist()
+        if profiler.enabled:
+            profiler.add('information', start)
+            profiler.end_step(self.step_index)
         return self.env['state'], self.env['reward'], self.env['done'], self.env['information']
 
-    def render_information(self):
-        print('  Rows:                             {}'.format(len(self.env['state']['ingredients_map'])))
-        print('  Columns:                          {}'.format(len(self.env['state']['ingredients_map'][0])))
-        print('  Min each ingredient per slice:    {}'.format(self.env['state']['min_each_ingredient_per_slice']))
-        print('  Max ingredients per slice:        {}'.format(self.env['state']['max_ingredients_per_slice']))
+    def initial_state(self):
+        if self.observation == 'numpy':
+            return self.google_engineer.numpy_state()
+        if self.observation == 'window':
+            return self.google_engineer.window_state(self.window_size)
+        return self.google_engineer.state()
+
+    def step_state(self):
+        '''
+        State after an action. In "numpy" observation the ingredients map is only
+        in the initial state, in "delta" observation only the changes are returned
+        (see GoogleEngineer.delta_state), in "window" observation maps are cut to
+        the window of window_size around the cursor (see GoogleEngineer.window_state).
+        '''
+
+        if self.observation == 'numpy':
+            return self.google_engineer.numpy_state(with_ingredients_map=False)
+        if self.observation == 'delta':
+            return self.google_engineer.delta_state()
+        if self.observation == 'window':
+            return self.google_engineer.window_state(self.window_size)
+        return self.google_engineer.state()
+
+    def full_env(self):
+        '''
+        Current environment with the full state as in "dict" observation.
+        '''
+
+        if self.observation == 'dict':
+            return self.env
+        return dict(self.env, state=self.google_engineer.state())
+
+    def render_information(self, env=None):
+        env = self.env if env is None else env
+        print('  Rows:                             {}'.format(len(env['state']['ingredients_map'])))
+        print('  Columns:                          {}'.format(len(env['state']['ingredients_map'][0])))
+        print('  Min each ingredient per slice:    {}'.format(env['state']['min_each_ingredient_per_slice']))
+        print('  Max ingredients per slice:        {}'.format(env['state']['max_ingredients_per_slice']))
         print('')
-        print('  Last action:                      {}'.format(self.env['information']['action']))
-        print('  Last reward:                      {}'.format(self.env['reward']))
+        print('  Last action:                      {}'.format(env['information']['action']))
+        print('  Last reward:                      {}'.format(env['reward']))
         print('')
-        print('  Cursor position:                  ({},{})'.format(*self.env['state']['cursor_position']))
-        print('  Slice mode:                       {}'.format('on' if self.env['state']['slice_mode'] else 'off'))
+        print('  Cursor position:                  ({},{})'.format(*env['state']['cursor_position']))
+        print('  Slice mode:                       {}'.format('on' if env['state']['slice_mode'] else 'off'))
         print('')
-        print('  Step:                             {}'.format(self.env['information']['step']))
-        print('  Score:                            {}'.format(self.env['information']['score']))
+        print('  Step:                             {}'.format(env['information']['step']))
+        print('  Score:                            {}'.format(env['information']['score']))
         print('')
         print('')
 
 
     def render(self):
+        env = self.full_env()
         print(self.hello)
-        self.render_information()
-        self.serve_pizza.print_from(self.env)
+        self.render_information(env)
+        self.serve_pizza.print_from(env)
         print(self.legend)
 
 
@@ -273,10 +578,13 @@ if __name__ == '__main__':
         ' at the position of the cursor. Otherwise, the cursor will move in the specified\n' + \
         ' direction.\n' + \
         '\n' + \
-        ' Before each action there will be a file "<name>/<step_index>_env.json"\n' + \
-        ' containing state, reward, game over and other information. If <name> parameter\n' + \
-        ' was not provided, states will not be saved into files. Initial state\n' + \
-        ' will be inside the file "<name>/ready_pizza_env.json".\n' + \
+        ' The game will be recorded into the file "<name>/trajectory.bin" that contains\n' + \
+        ' the pizza once and a small record for each step. Environment of any step\n' + \
+        ' can be printed with "python3 -m src.trajectory <name>/trajectory.bin --step <step>".\n' + \
+        ' If <name> parameter was not provided, the game will not be saved into files.\n' + \
+        '\n' + \
+        ' With --json_states, before each action there will be a file "<name>/<step_index>_env.json"\n' + \
+        ' containing state, reward, game over and other information instead.\n' + \
         '\n' + \
         ' The game ends when slices cannot be increased anymore or the game reached\n' + \
         ' maximum actions.\n' + \
@@ -301,11 +609,29 @@ if __name__ == '__main__':
         # TODO: info what in the states file
 
 
+    parser.add_argument('--input', default=None, help='pizza file in the format of Hash Code input ' + \
+        'to read at once instead of typing the pizza')
     parser.add_argument('--name', default=None, help='folder where the states will be saved')
+    parser.add_argument('--json_states', action='store_true', help='save every state into ' + \
+        'a separate json file instead of the trajectory file')
     parser.add_argument('--output', default=None, help='a path where to store final slices')
-    parser.add_argument('--max_steps', type=int, default=100, help='maximum steps to do before quiting')
+    parser.add_argument('--max_steps', type=int, default=None, help='maximum steps to do before quiting ' + \
+        '(default: 100, no limit with --batch)')
+    parser.add_argument('--batch', default=None, help='play actions from the file ("-" for the standard ' + \
+        'input after the pizza) without rendering and print the summary with the speed')
+    parser.add_argument('--checkpoint', type=int, default=None, help='with --batch and --name, save ' + \
+        'the environment into "<name>/<step_index>_env.json" every that many steps')
     parser.add_argument('--quiet', action='store_true', help='disable output')
     parser.add_argument('--render', action='store_true', help='render the pizza during playing')
+    parser.add_argument('--live', action='store_true', help='render the pizza in place, ' + \
+        'drawing again only what was changed by the last action')
+    parser.add_argument('--fps', type=float, default=30, help='maximum frames per second with --live')
+    parser.add_argument('--profile', action='store_true', help='count and time the phases ' + \
+        'of the steps and print them at the end')
+    parser.add_argument('--profile_every', type=int, default=None, help='with --profile, ' + \
+        'print the times every that many steps')
+    parser.add_argument('--cprofile', type=int, nargs=2, default=None, metavar=('FIRST', 'LAST'),
+        help='run cProfile from the first to the last step and print the slowest functions')
     parser.add_argument('--wasd', action='store_true', help='instead of passing "right", "down", "left", ' + \
         '"up", "toggle" you can use wasd keys and spacebar for toggle; this will also print help messages')
     args = parser.parse_args()
@@ -315,13 +641,30 @@ if __name__ == '__main__':
     wasd = args_dict.get('wasd')
     quiet = args_dict.get('quiet')
     render = args_dict.get('render')
+    live = LiveServePizza(args_dict.get('fps')) if args_dict.get('live') else None
     name = args_dict.get('name')
+    json_states = args_dict.get('json_states')
     max_steps = args_dict.get('max_steps')
-
-    game_args = { 'max_steps': max_steps }
+    input_path = args_dict.get('input')
+    batch = args_dict.get('batch')
+    checkpoint = args_dict.get('checkpoint')
+    prompts = not quiet and batch is None
+
+    if args_dict.get('profile'):
+        profiler.enable(log_every=args_dict.get('profile_every'))
+    if args_dict.get('cprofile') is not None:
+        profiler.profile_steps(*args_dict.get('cprofile'))
+
+    if max_steps is None:
+        max_steps = 100 if batch is None else float('inf')
+    if checkpoint is not None and (batch is None or name is None):
+        parser.error('--checkpoint requires --batch and --name')
+
+    game_args = { 'max_steps': max_steps, 'observation': 'dict' if batch is None else 'numpy' }
     game = Game(game_args)
+    trajectory = None
 
-    if not quiet:
+    if prompts:
         print(game.hello)
         print('\n Game rules:\n')
         print(game_rules)
@@ -333,77 +676,116 @@ if __name__ == '__main__':
             os.makedirs(name)
 
         # get pizza config
-        if not quiet:
-            print('Input {}'.format(pizza_config_line_description))
-            print('For example: 3 5 1 6')
+        start = time.time()
+        if input_path is not None:
+            pizza_config = load_pizza_config(input_path)
+        else:
+            if prompts:
+                print('Input {}'.format(pizza_config_line_description))
+                print('For example: 3 5 1 6')
+                print()
+                print('Your input:')
+
+            config_line = input('')
             print()
-            print('Your input:')
+            r, c, l, h = [int(n) for n in config_line.split(' ')]
+
+            pizza_lines = []
+            if prompts:
+                print()
+                print('Input:')
+                print(pizza_lines_description)
+                print('For example:')
+                print()
+                print('TTTTT')
+                print('TMMMT')
+                print('TTTTT')
+                print()
+                print('Your input:')
+
+            for i in range(r):
+                pizza_lines.append(input(''))
 
-        config_line = input('')
-        print()
-        r, c, l, h = [int(n) for n in config_line.split(' ')]
-
-        pizza_lines = []
-        if not quiet:
-            print()
-            print('Input:')
-            print(pizza_lines_description)
-            print('For example:')
-            print()
-            print('TTTTT')
-            print('TMMMT')
-            print('TTTTT')
             print()
-            print('Your input:')
-
-        for i in range(r):
-            pizza_lines.append(input(''))
-
-        print()
-        pizza_config = { 'pizza_lines': pizza_lines, 'r': r, 'c': c, 'l': l, 'h': h }
+            pizza_config = { 'pizza_lines': pizza_lines, 'r': r, 'c': c, 'l': l, 'h': h }
 
         # init game
         game.init(pizza_config)
         if render: game.render()
-        if name is not None:
+        if live is not None: live.start(game)
+        if name is not None and not json_states:
+            trajectory = TrajectoryWriter(os.path.join(name, 'trajectory.bin'), game)
+        if name is not None and json_states:
             env_filename = os.path.join(name, '{}_env.json'.format(game.env['information']['step']))
             with open(env_filename, 'w') as f:
-                json.dump(game.env, f, separators=(',',':'))
+                json.dump(game.full_env(), f, separators=(',',':'))
 
-        if not quiet:
-            print('Now you can use WASD keys to move/increase and space bar for toggling slice mode. Press CTRL-C or q to exit.')
-            print()
-
-        # run game
-        action_input = KeyInput() if wasd else StandardInput()
-        while not game.env['done']:
-            # get action
-            action = action_input.next()
-            game.step(action)
-            if render: game.render()
-            if name is not None:
+        if batch is not None:
+            init_time = time.time() - start
+            def save_checkpoint(game):
                 env_filename = os.path.join(name, '{}_env.json'.format(game.env['information']['step']))
                 with open(env_filename, 'w') as f:
-                    json.dump(game.env, f, separators=(',',':'))
-
-
+                    json.dump(game.full_env(), f, separators=(',',':'))
+
+            start = time.time()
+            with (sys.stdin if batch == '-' else open(batch)) as f:
+                times = play_batch(game, f, trajectory, checkpoint, save_checkpoint)
+            elapsed = time.time() - start
+
+            if not quiet:
+                steps = game.env['information']['step']
+                print('Score: {}, steps: {}, time: {:.2f}s, steps per second: {:.0f}'.format(
+                    game.env['information']['score'], steps, elapsed, steps / max(elapsed, 1e-9)))
+                print('Time of init: {:.3f}s, read: {:.3f}s, step: {:.3f}s, record: {:.3f}s, checkpoint: {:.3f}s'.format(
+                    init_time, times['read'], times['step'], times['record'], times['checkpoint']))
+                memory = game.google_engineer.pizza.memory()
+                print('Memory of the pizza: {:.1f}KB ({})'.format(sum(memory.values()) / 1024,
+                    ', '.join('{}: {:.1f}KB'.format(array, nbytes / 1024) for array, nbytes in memory.items())))
+        else:
+            if prompts:
+                print('Now you can use WASD keys to move/increase and space bar for toggling slice mode. Press CTRL-C or q to exit.')
+                print()
+
+            # run game
+            action_input = KeyInput() if wasd else StandardInput()
+            while not game.env['done']:
+                # get action
+                if live is not None: live.flush(game)
+                action = action_input.next()
+                game.step(action)
+                if render: game.render()
+                if live is not None: live.update(game)
+                if trajectory is not None:
+                    trajectory.write(game)
+                if name is not None and json_states:
+                    if profiler.enabled:
+                        start = time.perf_counter()
+                    env_filename = os.path.join(name, '{}_env.json'.format(game.env['information']['step']))
+                    with open(env_filename, 'w') as f:
+                        json.dump(game.env, f, separators=(',',':'))
+                    if profiler.enabled:
+                        profiler.add('json_dump', start)
 
     except (KeyboardInterrupt, EOFError):
         pass
     finally:
+        if trajectory is not None:
+            trajectory.close()
+        if live is not None and live.viewport is not None:
+            live.close(game)
+
         if game.env is not None:
             # save last environment
             if name is not None:
                 env_filename = os.path.join(name, 'ready_pizza_env.json')
                 with open(env_filename, 'w') as f:
-                    json.dump(game.env, f, separators=(',',':'))
+                    json.dump(game.full_env(), f, separators=(',',':'))
 
             # save slices
             if output:
                 with open(output, 'w') as f:
-                    slices = game.env['information']['slices']
-                    f.write('{}\n'.format(len(slices)))
-                    for slice in slices:
-                        f.write('{} {} {} {}\n'.format(*slice))
+                    write_slices(f, game.env['information']['slices'])
 
+        if args_dict.get('profile'):
+            profiler.log(profiler.log_line())
         if not quiet: print(game.goodbye)
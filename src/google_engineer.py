@@ -1,15 +1,27 @@
+from src.ingredients import signed_dtype
 from src.pizza import Pizza, Direction
+from src.profiler import profiler
+from src.valid_slices import ValidSlices
 
 import numpy as np
 import json
+import time
 
 POSITIVE_REWARD = 1.0
 NEUTRAL_REWARD  = 0.0
 NEGATIVE_REWARD = -0.1
 
+# index of an action is the value of its direction, toggle goes last
+ACTIONS = [direction.name for direction in Direction] + ['toggle']
+
 class ActionNotFoundException(Exception):
     pass
 
+def read_only(array):
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
 class GoogleEngineer:
     delta_position = {
         Direction.right: (0,1),
@@ -19,13 +31,17 @@ class GoogleEngineer:
     }
 
     def __init__(self, pizza_config):
-        self.pizza = Pizza(pizza_config['pizza_lines'])
+        # ingredients can be shared by pizzas with the same lines, see Ingredients.from_arrays
+        self.pizza = Pizza(pizza_config.get('pizza_lines'), pizza_config.get('ingredients'),
+            pizza_config['h'])
         self.min_each_ingredient_per_slice = pizza_config['l']
         self.max_ingredients_per_slice = pizza_config['h']
         self.cursor_position = (0,0)
         self.slice_mode = False
-        self.valid_slices = []
+        self.valid_slices = ValidSlices(self.pizza.c)
         self.score = 0
+        self.changed_slice = None
+        self._journal = None
 
     def score_of(self, slice):
         if min(self.pizza.ingredients.of(slice)) >= self.min_each_ingredient_per_slice:
@@ -43,19 +59,139 @@ class GoogleEngineer:
 
     def increase(self, direction):
         slice = self.pizza.slice_at(self.cursor_position)
+        # the slice shows the latest bounds of its id, so what is needed
+        # from it is taken before it is increased
+        slice_id = slice.id
+        slice_score = slice.score if slice.ingredients > 1 else self.score_of(slice)
+
         new_slice = self.pizza.increase(slice, direction, self.max_ingredients_per_slice)
-        if (new_slice is not None and min(self.pizza.ingredients.of(new_slice)) >=
-            self.min_each_ingredient_per_slice):
+        self.changed_slice = new_slice
+        if new_slice is None:
+            return NEGATIVE_REWARD
 
-            if slice in self.valid_slices:
-                self.valid_slices.remove(slice)
-            self.valid_slices.append(new_slice)
-            score = self.score_of(new_slice) - self.score_of(slice)
+        new_slice_score = self.score_of(new_slice)
+        self.pizza.slices.score[new_slice.id] = new_slice_score
+        if new_slice_score > 0:
+            if profiler.enabled:
+                start = time.perf_counter()
+            if self._journal is not None:
+                self._log_valid_slice(slice_id)
+                self._log_valid_slice(new_slice.id)
+            self.valid_slices.discard(slice_id)
+            self.valid_slices.add(new_slice)
+            if profiler.enabled:
+                profiler.add('valid_slices', start)
+            score = new_slice_score - slice_score
             self.score += score
             return score * POSITIVE_REWARD
-        return NEUTRAL_REWARD if new_slice is not None else NEGATIVE_REWARD
+        return NEUTRAL_REWARD
+
+    def place(self, r, c, height, width):
+        '''
+        Cut the slice of height x width with the top left corner at (r,c) in one
+        action. The slice at (r,c) is increased down and then right until it has
+        this size, with the same rules and rewards as increase actions, and the
+        cursor is left at (r,c). If any of the increases is not possible, nothing
+        is changed and NEGATIVE_REWARD is returned, otherwise the sum of rewards.
+        '''
+
+        self.changed_slice = None
+        r1, c1 = r+height-1, c+width-1
+        if not (0 <= r <= r1 < self.pizza.r and 0 <= c <= c1 < self.pizza.c):
+            return NEGATIVE_REWARD
+
+        slice_r0, slice_c0, slice_r1, slice_c1 = self.pizza.slice_at((r,c)).as_tuple
+        increases = [Direction.down] * (r1-slice_r1) + [Direction.right] * (c1-slice_c1)
+        if slice_r0 != r or slice_c0 != c or min(r1-slice_r1, c1-slice_c1) < 0 or len(increases) == 0:
+            return NEGATIVE_REWARD
+
+        snapshots = self._journal is not None
+        token = self.snapshot()
+        self.cursor_position = (r,c)
+        reward = NEUTRAL_REWARD
+        for direction in increases:
+            increase_reward = self.increase(direction)
+            if self.changed_slice is None:
+                self.restore(token)
+                reward = NEGATIVE_REWARD
+                break
+            reward += increase_reward
+        if not snapshots:
+            self.forget_snapshots()
+        return reward
+
+    def action_mask(self):
+        '''
+        Return boolean array with an item for each of ACTIONS, which is False if
+        the action would certainly get NEGATIVE_REWARD: moving off the pizza or
+        increasing a slice that cannot be increased in that direction. Toggle is
+        always allowed.
+        '''
+
+        mask = np.ones(len(ACTIONS), dtype=bool)
+        ri, ci = self.cursor_position
+        if not self.slice_mode:
+            mask[Direction.right.value] = ci+1 < self.pizza.c
+            mask[Direction.down.value] = ri+1 < self.pizza.r
+            mask[Direction.left.value] = ci > 0
+            mask[Direction.up.value] = ri > 0
+            return mask
+
+        slice_id = self.pizza._map[ri,ci]
+        if slice_id == -1:
+            r0, c0, height, width = ri, ci, 1, 1
+        else:
+            r0, c0, r1, c1 = self.pizza.slices.bounds_of(slice_id)
+            height, width = r1-r0+1, c1-c0+1
+        mask[:4] = self.pizza.can_increase_at((r0,c0))
+        # increasing right or left adds a column, down or up adds a row
+        area = height * width
+        if area + height > self.max_ingredients_per_slice:
+            mask[[Direction.right.value, Direction.left.value]] = False
+        if area + width > self.max_ingredients_per_slice:
+            mask[[Direction.down.value, Direction.up.value]] = False
+        return mask
+
+    def _log_valid_slice(self, slice_id):
+        self._journal.append((self.valid_slices.restore,
+            (slice_id, self.valid_slices.bounds_of(slice_id))))
+
+    def snapshot(self):
+        '''
+        Return a token to restore the current state with. From the first snapshot
+        on, every change of the pizza and the valid slices is logged together with
+        the overwritten values, so restoring undoes only what was changed since the
+        snapshot, while the ingredients are never copied.
+        '''
+
+        if self._journal is None:
+            self._journal = []
+            self.pizza._journal = self._journal
+        return (len(self._journal), self.cursor_position, self.slice_mode, self.score,
+            self.changed_slice, self.pizza._can_increase_count)
+
+    def restore(self, token):
+        '''
+        Go back to the state of the snapshot. Tokens of snapshots taken after it
+        cannot be used anymore.
+        '''
+
+        length, self.cursor_position, self.slice_mode, self.score, self.changed_slice, \
+            self.pizza._can_increase_count = token
+        while len(self._journal) > length:
+            undo, args = self._journal.pop()
+            undo(*args)
+
+    def forget_snapshots(self):
+        '''
+        Stop logging changes. Tokens of all the snapshots cannot be used anymore.
+        '''
+
+        self._journal = None
+        self.pizza._journal = None
 
     def do(self, action):
+        self.changed_slice = None
         if action == 'toggle':
             self.slice_mode = not self.slice_mode
             return NEUTRAL_REWARD
@@ -78,3 +214,75 @@ class GoogleEngineer:
             'min_each_ingredient_per_slice': self.min_each_ingredient_per_slice,
             'max_ingredients_per_slice': self.max_ingredients_per_slice,
         }
+
+    def numpy_state(self, with_ingredients_map=True):
+        '''
+        Same as state, but maps are read-only views of the pizza arrays instead of
+        lists, so they change together with the pizza. Ingredients never change
+        during the game, so they can be left out after the first state.
+        '''
+
+        state = {
+            'slices_map': read_only(self.pizza._map),
+            'cursor_position': self.cursor_position,
+            'slice_mode': self.slice_mode,
+            'min_each_ingredient_per_slice': self.min_each_ingredient_per_slice,
+            'max_ingredients_per_slice': self.max_ingredients_per_slice,
+        }
+        if with_ingredients_map:
+            state['ingredients_map'] = read_only(self.pizza.ingredients._map)
+        return state
+
+    def window_state(self, size):
+        '''
+        Same as state, but maps are cut to the size x size window centered on the
+        cursor, so the state does not depend on the size of the pizza. Cells of
+        the window outside of the pizza are -1 in the ingredients and the slices
+        windows, where 1 is a cell in a slice and 0 is a free one, and they cannot
+        be increased. Only the window is read from the pizza arrays.
+        '''
+
+        ri, ci = self.cursor_position
+        r0, c0 = ri - size//2, ci - size//2
+        top, left = max(r0, 0), max(c0, 0)
+        bottom, right = min(r0+size, self.pizza.r), min(c0+size, self.pizza.c)
+        window = np.s_[top-r0:bottom-r0, left-c0:right-c0]
+        pizza = np.s_[top:bottom, left:right]
+
+        ingredients = np.full((size,size), -1, dtype=signed_dtype(self.pizza.ingredients.total_unique))
+        ingredients[window] = self.pizza.ingredients._map[pizza]
+        slices = np.full((size,size), -1, dtype=np.int8)
+        slices[window] = self.pizza._map[pizza] != -1
+        can_increase = np.zeros((size,size,4), dtype=bool)
+        can_increase[window] = self.pizza.can_increase_map(pizza)
+
+        return {
+            'ingredients_window': ingredients,
+            'slices_window': slices,
+            'can_increase_window': can_increase,
+            'cursor_position': self.cursor_position,
+            'slice_mode': self.slice_mode,
+            'score': self.score,
+            'min_each_ingredient_per_slice': self.min_each_ingredient_per_slice,
+            'max_ingredients_per_slice': self.max_ingredients_per_slice,
+        }
+
+    def delta_state(self):
+        '''
+        Return only what was changed by the last action: cursor, slice mode and the
+        rectangle r0, c0, r1, c1 of the slices map that was cut with the new values
+        of the slices map inside it. Rectangle and values are None if no slice was cut.
+        '''
+
+        rect, values = None, None
+        if self.changed_slice is not None:
+            rect = self.changed_slice.as_tuple
+            r0, c0, r1, c1 = rect
+            values = self.pizza._map[r0:r1+1, c0:c1+1].tolist()
+
+        return {
+            'slices_map_rect': rect,
+            'slices_map_values': values,
+            'cursor_position': self.cursor_position,
+            'slice_mode': self.slice_mode,
+        }
@@ -1,40 +1,140 @@
 import numpy as np
 
+def signed_dtype(n):
+    '''
+    Return the smallest signed integer type for values from -1 to n, for example
+    slice ids of a pizza with -1 for free cells.
+    '''
+
+    for dtype in [np.int8, np.int16, np.int32]:
+        if n <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+def count_dtype(n):
+    '''
+    Return the integer type for prefix sums of counts up to n. An unsigned type
+    is used while it holds n: differences of prefix sums may wrap around in it,
+    but the count of any area is not more than n, so it comes out right and is
+    then cast to int32 for the callers.
+    '''
+
+    return np.uint16 if n <= np.iinfo(np.uint16).max else np.int32
+
+def ids_of(codes):
+    '''
+    Return unique ingredients sorted by their codes and the array of ingredient
+    ids, which are indices of the unique ingredients, as uint8 if there are not
+    more than 256 unique ingredients. Codes (unicode code points) that fit into
+    a byte are looked up in a table without sorting.
+    '''
+
+    if len(codes) > 0 and codes.max() < 256:
+        present = np.zeros(256, dtype=bool)
+        present[codes] = True
+        unique_codes = np.flatnonzero(present)
+        table = np.zeros(256, dtype=np.uint8)
+        table[unique_codes] = np.arange(len(unique_codes))
+        ids = table[codes]
+    else:
+        unique_codes, ids = np.unique(codes, return_inverse=True)
+        ids = ids.astype(np.uint8 if len(unique_codes) <= 256 else np.int32)
+    return np.array([chr(code) for code in unique_codes.tolist()], dtype='<U1'), ids
+
 class Ingredients:
     '''
     Class for calculations of ingredients inside an area.
     '''
 
     def __init__(self, pizza_lines):
-        self._lines = [list(l) for l in pizza_lines]
-        self._unique, self._map = np.unique(self._lines, return_inverse=True)
-        self._map = self._map.reshape((len(self._lines),len(self._lines[0])))
+        r, c = len(pizza_lines), len(pizza_lines[0])
+        if any(len(line) != c for line in pizza_lines):
+            raise ValueError('Expected {} lines of {} ingredients, but found lines with lengths {}.'.format(
+                r, c, sorted(set(len(line) for line in pizza_lines))))
+        codes = np.frombuffer(''.join(pizza_lines).encode('utf-32-le'), dtype='<u4')
+        unique, ingredients_map = ids_of(codes)
+        self._set_map(unique, ingredients_map.reshape((r,c)))
+        self.initialize()
+
+    @classmethod
+    def from_bytes(cls, data, r, c):
+        '''
+        Create ingredients from bytes of R rows of C one byte ingredients, which
+        are separated by whitespace, for example the pizza part of a Hash Code
+        input file. Ingredients are decoded with a lookup table on the whole
+        buffer, so no python object is created for a cell.
+        '''
+
+        rows = data.split()
+        if len(rows) != r or any(len(row) != c for row in rows):
+            raise ValueError('Expected {} rows of {} ingredients, but found {} rows with lengths {}.'.format(
+                r, c, len(rows), sorted(set(len(row) for row in rows))))
+        unique, ingredients_map = ids_of(np.frombuffer(b''.join(rows), dtype=np.uint8))
+        return cls.from_arrays(unique, ingredients_map.reshape((r,c)))
+
+    @classmethod
+    def from_arrays(cls, unique, ingredients_map, padded_from_origin=None):
+        '''
+        Create ingredients from the arrays of other ingredients without parsing
+        pizza lines. Arrays are used as they are, without copying, so they can be
+        in shared memory; the prefix sums are calculated only if not provided.
+        '''
+
+        ingredients = cls.__new__(cls)
+        ingredients._set_map(unique, ingredients_map)
+        if padded_from_origin is None:
+            ingredients.initialize()
+        else:
+            ingredients._padded_from_origin = padded_from_origin
+            ingredients._from_origin = padded_from_origin[1:,1:]
+        return ingredients
+
+    def _set_map(self, unique, ingredients_map):
+        self._unique, self._map = unique, ingredients_map
         self.shape = self._map.shape
 
         self.total = self.shape[0]*self.shape[1]
-        self.total_unique = np.max(self._map)+1
+        self.total_unique = len(self._unique)
 
-        self.initialize()
+    def sub(self, r0, c0, r1, c1):
+        '''
+        Return ingredients of the area from (r0,c0) to (r1,c1) inclusive with
+        its own coordinates, so (r0,c0) becomes the origin. The ingredients map is
+        a view of this one, and all unique ingredients are kept even if some of
+        them are not in the area.
+        '''
+
+        p = self._padded_from_origin[r0:r1+2, c0:c1+2]
+        return Ingredients.from_arrays(self._unique, self._map[r0:r1+1, c0:c1+1],
+            p - p[:1] - p[:,:1] + p[:1,:1])
 
     def initialize(self):
         '''
         Create an array for faster calculation of ingredients inside an area.
+
+        Element [r+1][c+1][i] of the padded array is the number of ingredient
+        with id i inside the area from the origin to (r,c) inclusive, so the first
+        row and column are zeros and no bounds checks are needed for lookups.
+        Its type depends on the size of the pizza (see count_dtype).
         '''
 
-        from_origin = np.zeros((*self.shape, self.total_unique))
+        one_hot = self._map[:,:,np.newaxis] == np.arange(self.total_unique)
+
+        dtype = count_dtype(self.total)
+        self._padded_from_origin = np.zeros(
+            (self.shape[0]+1, self.shape[1]+1, self.total_unique), dtype=dtype)
+        np.cumsum(one_hot, axis=0, dtype=dtype, out=self._padded_from_origin[1:,1:])
+        np.cumsum(self._padded_from_origin[1:,1:], axis=1, out=self._padded_from_origin[1:,1:])
 
-        for r in range(self.shape[0]):
-            for c in range(self.shape[1]):
-                ingredient_id = self._map[r][c]
-                from_origin[r][c][ingredient_id] = 1
-                if r > 0:
-                    from_origin[r][c] += from_origin[r-1][c]
-                if c > 0:
-                    from_origin[r][c] += from_origin[r][c-1]
-                if r > 0 and c > 0:
-                    from_origin[r][c] -= from_origin[r-1][c-1]
+        self._from_origin = self._padded_from_origin[1:,1:]
+
+    def as_lines(self):
+        '''
+        Return pizza lines that the ingredients were created from.
+        '''
 
-        self._from_origin = from_origin
+        codes = np.array([ord(ingredient) for ingredient in self._unique], dtype=np.uint32)
+        return [row.tobytes().decode('utf-32-le') for row in codes[self._map].astype('<u4')]
 
     def of(self, slice):
         '''
@@ -42,15 +142,23 @@ class Ingredients:
         ingredient with id i inside specified slice.
         '''
 
-        ingredients_inside_slice = np.copy(self._from_origin[
-                slice.r1,
-                slice.c1])
+        p = self._padded_from_origin
+        return (
+            p[slice.r1+1, slice.c1+1] -
+            p[slice.r0,   slice.c1+1] -
+            p[slice.r1+1, slice.c0] +
+            p[slice.r0,   slice.c0]).astype(np.int32)
+
+    def of_many(self, bounds):
+        '''
+        Return 2d array of number of ingredients for many slices at once. Bounds are
+        an array of shape (N,4) where each row is r0, c0, r1, c1 of a slice, so
+        [n][i] element of the result is the number of ingredient with id i inside
+        n-th slice.
+        '''
 
-        if slice.r0 > 0:
-            ingredients_inside_slice -= self._from_origin[slice.r0-1][slice.c1]
-        if slice.c0 > 0:
-            ingredients_inside_slice -= self._from_origin[slice.r1][slice.c0-1]
-        if slice.r0 > 0 and slice.c0 > 0:
-            ingredients_inside_slice += self._from_origin[slice.r0-1][slice.c0-1]
+        bounds = np.asarray(bounds, dtype=np.intp).reshape((-1,4))
+        r0, c0, r1, c1 = bounds[:,0], bounds[:,1], bounds[:,2]+1, bounds[:,3]+1
 
-        return ingredients_inside_slice
+        p = self._padded_from_origin
+        return (p[r1,c1] - p[r0,c1] - p[r1,c0] + p[r0,c0]).astype(np.int32)
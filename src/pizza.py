@@ -1,6 +1,8 @@
-from src.ingredients import Ingredients
+from src.ingredients import Ingredients, signed_dtype
+from src.profiler import profiler
 
 import numpy as np
+import time
 from enum import Enum
 
 class Direction(Enum):
@@ -18,6 +20,29 @@ class Direction(Enum):
             cls.up: cls.down,
         })[direction]
 
+# values of the opposite directions by the values of the directions
+OPPOSITE = [Direction.opposite(direction).value for direction in Direction]
+
+# can increase flags of a cell are packed into bits of one uint8 by the values of
+# the directions: FLAG_BITS[direction] is the bit of the direction (as uint8, so
+# numpy does not convert it on every use) and UNPACK_FLAGS[flags] is the array of
+# the four flags
+FLAG_BITS = [np.uint8(1 << direction.value) for direction in Direction]
+UNPACK_FLAGS = (np.arange(16)[:,np.newaxis] >> np.arange(4) & 1).astype(bool)
+
+def initial_flags(flags, r, c):
+    '''
+    Set the can increase flags of an R x C pizza before any cut, every cell can be
+    increased towards the cells next to it. Return the number of flags set.
+    '''
+
+    flags[...] = 0
+    flags[:r,:c-1] |= FLAG_BITS[Direction.right.value]
+    flags[:r-1,:c] |= FLAG_BITS[Direction.down.value]
+    flags[:r,1:c] |= FLAG_BITS[Direction.left.value]
+    flags[1:r,:c] |= FLAG_BITS[Direction.up.value]
+    return int(np.count_nonzero(np.unpackbits(flags)))
+
 class Slice:
     delta_increase_slice = {
         Direction.right: (0,0,0,1),
@@ -58,89 +83,279 @@ class Slice:
     def __str__(self):
         return '{} {} {} {}'.format(*self.as_tuple)
 
+class SliceTable:
+    '''
+    Slices stored as columns of one preallocated array indexed by slice id
+    (r0*c+c0), instead of a python object for each slice. Only rows of ids of
+    the slices on the pizza and of the free cells that were looked at are filled.
+    A row is a record of bounds of the smallest type for R and C, and area and
+    score of the smallest type for max_area, the biggest area of a slice (R*C by
+    default).
+    '''
+
+    columns = ['r0', 'c0', 'r1', 'c1', 'area', 'score']
+
+    def __init__(self, r, c, max_area=None):
+        coordinate = signed_dtype(max(r, c))
+        size = signed_dtype(r*c if max_area is None else min(r*c, max_area))
+        self._rows = np.zeros(r*c, dtype=[(column, coordinate if i < 4 else size)
+            for i, column in enumerate(self.columns)])
+
+    r0 = property(lambda self: self._rows['r0'])
+    c0 = property(lambda self: self._rows['c0'])
+    r1 = property(lambda self: self._rows['r1'])
+    c1 = property(lambda self: self._rows['c1'])
+    area = property(lambda self: self._rows['area'])
+    score = property(lambda self: self._rows['score'])
+
+    def set(self, slice_id, r0, c0, r1, c1, score=0):
+        self._rows[slice_id] = r0, c0, r1, c1, (r1-r0+1) * (c1-c0+1), score
+
+    def bounds_of(self, slice_id):
+        return self._rows.item(slice_id)[:4]
+
+class SliceView:
+    '''
+    Slice that reads its bounds from a row of SliceTable. It has the same
+    attributes as Slice, but it follows the row, so it shows the latest bounds
+    of the slice with its id. The id is the top left cell of the slice, so a
+    view follows increases to the right and down, but it is stale after an
+    increase to the left or up, which moves the slice to a new id.
+    '''
+
+    __slots__ = ('_table', 'id')
+
+    def __init__(self, table, slice_id):
+        self._table = table
+        self.id = slice_id
+
+    @property
+    def r0(self):
+        return int(self._table.r0[self.id])
+
+    @property
+    def c0(self):
+        return int(self._table.c0[self.id])
+
+    @property
+    def r1(self):
+        return int(self._table.r1[self.id])
+
+    @property
+    def c1(self):
+        return int(self._table.c1[self.id])
+
+    @property
+    def as_tuple(self):
+        return self._table.bounds_of(self.id)
+
+    @property
+    def ingredients(self):
+        return int(self._table.area[self.id])
+
+    @property
+    def score(self):
+        return int(self._table.score[self.id])
+
+    def increase(self, direction):
+        return Slice(*self.as_tuple).increase(direction)
+
+    def side(self, direction):
+        return Slice(*self.as_tuple).side(direction)
+
+    def is_within(self, slice):
+        return Slice(*self.as_tuple).is_within(slice)
+
+    def __str__(self):
+        return '{} {} {} {}'.format(*self.as_tuple)
+
 class Pizza:
-    def __init__(self, pizza_lines):
-        self.ingredients = Ingredients(pizza_lines)
+    '''
+    State of the cuts of the pizza in compact arrays, which are chosen by the size
+    of the pizza: the slices map of slice ids (-1 for free cells) is of the
+    smallest type for R*C, and the four can increase flags of a cell are bits of
+    one uint8 (see UNPACK_FLAGS). Flags are read with can_increase, can_increase_at
+    and can_increase_map. Slices are not bigger than max_ingredients given to
+    increase, which should not be more than max_slice_area, if it is given.
+    '''
+
+    def __init__(self, pizza_lines, ingredients=None, max_slice_area=None):
+        self.ingredients = Ingredients(pizza_lines) if ingredients is None else ingredients
 
         self.r, self.c = self.ingredients.shape
 
-        self._dict = {}
-        self._map = np.full((self.r,self.c), -1)
-        self._map_can_increase = np.full((self.r,self.c,4), False)
-        self._map_can_increase[:,:-1,Direction.right.value] = True
-        self._map_can_increase[:-1,:,Direction.down.value] = True
-        self._map_can_increase[:,1:,Direction.left.value] = True
-        self._map_can_increase[1:,:,Direction.up.value] = True
+        self.slices = SliceTable(self.r, self.c, max_slice_area)
+        self._map = np.full((self.r,self.c), -1, dtype=signed_dtype(self.r*self.c))
+        self._can_increase = np.zeros((self.r,self.c), dtype=np.uint8)
+        self._can_increase_count = initial_flags(self._can_increase, self.r, self.c)
+        self._journal = None
 
         self.huge_slice = Slice(0,0,self.r-1,self.c-1)
 
+    def _log(self, array, index):
+        '''
+        Remember how to undo a change of the array at the index (see GoogleEngineer.snapshot).
+        '''
+
+        self._journal.append((array.__setitem__, (index, array[index].copy())))
+
     def slice_ids_in(self, slice):
-        slice_ids = list(np.unique(self._map[
-            slice.r0:slice.r1+1,
-            slice.c0:slice.c1+1]))
+        return self._slice_ids_in(*slice.as_tuple)
+
+    def _slice_ids_in(self, r0, c0, r1, c1):
+        slice_ids = list(np.unique(self._map[r0:r1+1, c0:c1+1]))
         if -1 in slice_ids:
             slice_ids.remove(-1)
         return slice_ids
 
+    def _side_slice_ids(self, r0, c0, r1, c1):
+        '''
+        Return ids of the slices in a side strip, which is one row or one column.
+        The strip is walked along the slices map and each slice found is jumped
+        over to its end from the slice table, so the cost is the number of free
+        cells and slices in the strip and no sorting is needed.
+        '''
+
+        if r0 == r1:
+            strip, start, ends = self._map[r0, c0:c1+1].tolist(), c0, self.slices.c1
+        else:
+            strip, start, ends = self._map[r0:r1+1, c0].tolist(), r0, self.slices.r1
+
+        slice_ids = []
+        i = 0
+        while i < len(strip):
+            slice_id = strip[i]
+            if slice_id == -1:
+                i += 1
+            else:
+                slice_ids.append(slice_id)
+                i = int(ends[slice_id]) + 1 - start
+        return slice_ids
+
     def disable_increase_of(self, slice, direction):
-        self._map_can_increase[
-            slice.r0:slice.r1+1,
-            slice.c0:slice.c1+1,
-            direction.value] = False
+        self._disable_increase(*slice.as_tuple, direction.value)
+
+    def _disable_increase(self, r0, c0, r1, c1, direction):
+        flags = self._can_increase[r0:r1+1, c0:c1+1]
+        cleared = flags & FLAG_BITS[direction]
+        count = int(np.count_nonzero(cleared))
+        # often the flags were cleared before, then there is nothing to change
+        if count > 0:
+            if self._journal is not None:
+                self._log(self._can_increase, np.s_[r0:r1+1, c0:c1+1])
+            self._can_increase_count -= count
+            flags ^= cleared
 
     def disable_increase_around(self, slice, direction, max_ingredients):
-        side = slice.side(direction)
-        side_increase_direction = Direction.opposite(direction)
+        self._disable_increase_around(*slice.as_tuple, direction, max_ingredients)
+
+    def _disable_increase_around(self, r0, c0, r1, c1, direction, max_ingredients):
+        side_r0, side_c0, side_r1, side_c1 = Slice.delta_side_fn[direction](r0, c0, r1, c1)
+        side_increase_direction = OPPOSITE[direction.value]
 
         # if on the edge of the pizza
-        if not side.is_within(self.huge_slice):
-            self.disable_increase_of(slice, direction)
+        if side_r0 < 0 or side_c0 < 0 or side_r1 >= self.r or side_c1 >= self.c:
+            self._disable_increase(r0, c0, r1, c1, direction.value)
             return
 
         # if cannot increase anymore because of the max ingredients per slice
-        if slice.ingredients + side.ingredients > max_ingredients:
-            self.disable_increase_of(slice, direction)
+        ingredients = (r1-r0+1) * (c1-c0+1)
+        side_ingredients = (side_r1-side_r0+1) * (side_c1-side_c0+1)
+        if ingredients + side_ingredients > max_ingredients:
+            self._disable_increase(r0, c0, r1, c1, direction.value)
 
         # disable for all side slices
-        side_slice_ids = self.slice_ids_in(side)
+        side_slice_ids = self._side_slice_ids(side_r0, side_c0, side_r1, side_c1)
         for slice_id in side_slice_ids:
-            self.disable_increase_of(self._dict[slice_id], side_increase_direction)
-        self.disable_increase_of(side, side_increase_direction)
+            self._disable_increase(*self.slices.bounds_of(slice_id), side_increase_direction)
+        self._disable_increase(side_r0, side_c0, side_r1, side_c1, side_increase_direction)
 
         # disable for slice if there are slices on the side
         if len(side_slice_ids) > 0:
-            self.disable_increase_of(slice, direction)
+            self._disable_increase(r0, c0, r1, c1, direction.value)
 
     def slice_at(self, position):
         ri, ci = position
-        slice_id = self._map[ri][ci]
+        slice_id = int(self._map[ri,ci])
         if slice_id == -1:
-            return Slice(ri,ci,ri,ci)
-        return self._dict[slice_id]
+            slice_id = ri*self.c+ci
+            self.slices.set(slice_id, ri, ci, ri, ci)
+        return SliceView(self.slices, slice_id)
 
     def increase(self, slice, direction, max_ingredients):
-        slice_id = slice.r0*self.c+slice.c0
-        new_slice = slice.increase(direction)
-        new_slice_id = new_slice.r0*self.c+new_slice.c0
-
-        if (self._map_can_increase[slice.r0][slice.c0][direction.value] and
-            new_slice.ingredients <= max_ingredients):
+        r0, c0, r1, c1 = slice.as_tuple
+        dr0, dc0, dr1, dc1 = Slice.delta_increase_slice[direction]
+        new_r0, new_c0, new_r1, new_c1 = r0+dr0, c0+dc0, r1+dr1, c1+dc1
+        new_slice_id = new_r0*self.c+new_c0
 
-            if slice.ingredients>1: del self._dict[slice_id]
-            self._dict[new_slice_id] = new_slice
+        if (self._can_increase[r0,c0] & FLAG_BITS[direction.value] and
+            (new_r1-new_r0+1) * (new_c1-new_c0+1) <= max_ingredients):
 
-            self._map[
-                new_slice.r0:new_slice.r1+1,
-                new_slice.c0:new_slice.c1+1] = new_slice_id
+            if profiler.enabled:
+                start = time.perf_counter()
+            if self._journal is not None:
+                self._log(self.slices._rows, new_slice_id)
+                self._log(self._map, np.s_[new_r0:new_r1+1, new_c0:new_c1+1])
+            self.slices.set(new_slice_id, new_r0, new_c0, new_r1, new_c1)
+            self._map[new_r0:new_r1+1, new_c0:new_c1+1] = new_slice_id
+            if profiler.enabled:
+                start = profiler.add('cut', start)
 
             for direction in Direction:
-                self.disable_increase_around(new_slice, direction, max_ingredients)
-                # print(self._map_can_increase)
-                # print('----')
+                self._disable_increase_around(
+                    new_r0, new_c0, new_r1, new_c1, direction, max_ingredients)
+            if profiler.enabled:
+                profiler.add('disable_increase_around', start)
 
-            return new_slice
+            return SliceView(self.slices, new_slice_id)
         return None
 
+    def can_increase(self, position, direction):
+        '''
+        Return True if the slice with the top left corner at the position can be
+        increased in the direction.
+        '''
+
+        return bool(self._can_increase[position] & FLAG_BITS[direction.value])
+
+    def can_increase_at(self, position):
+        '''
+        Return boolean array of the flags of the cell at the position, indexed by
+        the values of the directions.
+        '''
+
+        return UNPACK_FLAGS[self._can_increase[position]]
+
+    def can_increase_map(self, area=np.s_[:,:]):
+        '''
+        Return R x C x 4 boolean array of the flags of all cells, or of the cells
+        of the area (a pair of slices).
+        '''
+
+        return UNPACK_FLAGS[self._can_increase[area]]
+
+    def memory(self):
+        '''
+        Return bytes of the arrays of the pizza by their names. Ingredients can be
+        shared by many pizzas (see Ingredients.from_arrays), so they are the last.
+        '''
+
+        return {
+            'slices_map': self._map.nbytes,
+            'can_increase': self._can_increase.nbytes,
+            'slices_table': self.slices._rows.nbytes,
+            'ingredients_map': self.ingredients._map.nbytes,
+            'ingredients_prefix_sums': self.ingredients._padded_from_origin.nbytes,
+        }
+
+    @property
+    def growable_frontier(self):
+        '''
+        Remaining growable frontier: the number of (cell, direction) pairs in which
+        the pizza can still be increased. The game is over when it reaches zero.
+        '''
+
+        return self._can_increase_count
+
     def can_increase_more(self):
-        # print(self._map_can_increase)
-        return np.any(self._map_can_increase)
+        return self._can_increase_count > 0
@@ -0,0 +1,20 @@
+from concurrent.futures import wait, FIRST_COMPLETED
+from itertools import islice
+
+def map_unordered(executor, fn, items, in_flight):
+    '''
+    Yield fn(item) for each of the items in the order of completion, with not
+    more than in_flight calls submitted to the executor at once, so items are
+    taken from the iterable only as results come back.
+    '''
+
+    items = iter(items)
+    pending = set()
+    while True:
+        for item in islice(items, in_flight - len(pending)):
+            pending.add(executor.submit(fn, item))
+        if len(pending) == 0:
+            return
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield future.result()
@@ -0,0 +1,115 @@
+import sys
+import time
+
+class Profiler:
+    '''
+    Counters and cumulative time of the phases of a step. Instrumented code checks
+    enabled before taking any time, so when it is off a phase costs one attribute
+    lookup:
+
+        if profiler.enabled:
+            start = time.perf_counter()
+        ...
+        if profiler.enabled:
+            profiler.add('phase', start)
+
+    Game.step calls begin_step and end_step, which also log a line every
+    log_every steps and run hooks attached to a range of steps, for example
+    cProfile with profile_steps.
+    '''
+
+    def __init__(self):
+        self.enabled = False
+        self.log_every = None
+        self.log = lambda line: sys.stderr.write(line + '\n')
+        self.hooks = []
+        self.reset()
+
+    def reset(self):
+        self.counts = {}
+        self.seconds = {}
+        self.steps = 0
+        self.started = time.perf_counter()
+
+    def enable(self, log_every=None, log=None):
+        self.enabled = True
+        self.log_every = log_every
+        if log is not None:
+            self.log = log
+
+    def disable(self):
+        self.enabled = False
+
+    def add(self, phase, start):
+        '''
+        Count the phase that started at start and return the time now, so that
+        the next phase can start from it.
+        '''
+
+        now = time.perf_counter()
+        self.counts[phase] = self.counts.get(phase, 0) + 1
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + now - start
+        return now
+
+    def attach(self, first_step, last_step, start, stop):
+        '''
+        Call start() before the first step and stop() after the last step of the
+        range. Enables the profiler, as steps are not followed otherwise.
+        '''
+
+        self.hooks.append((first_step, last_step, start, stop))
+        self.enabled = True
+
+    def profile_steps(self, first_step, last_step, path=None):
+        '''
+        Run cProfile for the range of steps. Stats are saved into the file at path,
+        or the top functions by cumulative time are logged.
+        '''
+
+        import cProfile, io, pstats
+        profile = cProfile.Profile()
+
+        def stop():
+            profile.disable()
+            if path is not None:
+                profile.dump_stats(path)
+                return
+            out = io.StringIO()
+            pstats.Stats(profile, stream=out).sort_stats('cumulative').print_stats(30)
+            self.log('Profile of steps {}-{}:\n{}'.format(first_step, last_step, out.getvalue()))
+
+        self.attach(first_step, last_step, profile.enable, stop)
+
+    def begin_step(self, step):
+        for first_step, last_step, start, stop in self.hooks:
+            if step == first_step:
+                start()
+
+    def end_step(self, step):
+        self.steps += 1
+        for first_step, last_step, start, stop in self.hooks:
+            if step == last_step:
+                stop()
+        if self.log_every and self.steps % self.log_every == 0:
+            self.log(self.log_line())
+
+    def stats(self):
+        return {
+            'steps': self.steps,
+            'seconds': time.perf_counter() - self.started,
+            'phases': {
+                phase: {
+                    'count': self.counts[phase],
+                    'seconds': self.seconds[phase],
+                    'mean_us': 1e6 * self.seconds[phase] / self.counts[phase],
+                } for phase in self.counts},
+        }
+
+    def log_line(self):
+        stats = self.stats()
+        return 'Steps: {}, steps per second: {:.0f}, {}'.format(
+            stats['steps'], stats['steps'] / max(stats['seconds'], 1e-9),
+            ', '.join('{}: {:.1f}us x {}'.format(phase, phase_stats['mean_us'], phase_stats['count'])
+                for phase, phase_stats in stats['phases'].items()))
+
+profiler = Profiler()
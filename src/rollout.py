@@ -0,0 +1,221 @@
+from src.game import Game, load_pizza_config
+from src.google_engineer import ACTIONS
+from src.ingredients import Ingredients
+from src.pool import map_unordered
+from src.trajectory import TrajectoryWriter, fill_record, record_dtype
+
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import os
+
+try:
+    from multiprocessing.shared_memory import SharedMemory
+except ImportError:
+    # python before 3.8, workers get copies of the ingredients instead
+    SharedMemory = None
+
+class SharedIngredients:
+    '''
+    Arrays of ingredients (unique ingredients, ingredients map and prefix sums)
+    in one block of shared memory. The process that created the block passes
+    descriptor to other processes, which attach to the block by its name and get
+    ingredients that read the same memory, so nothing is parsed or copied again.
+    Without multiprocessing.shared_memory (python before 3.8) the descriptor holds
+    the arrays themselves, so every process gets a copy of them.
+    '''
+
+    def __init__(self, shared_memory, layout, owner=False, arrays=None):
+        self._shared_memory = shared_memory
+        self.layout = layout
+        self.owner = owner
+        self.arrays = {} if arrays is None else dict(arrays)
+        for key, dtype, shape, offset in layout:
+            self.arrays[key] = np.ndarray(shape, dtype=dtype, buffer=shared_memory.buf, offset=offset)
+
+    @classmethod
+    def create(cls, ingredients):
+        arrays = {
+            'unique': ingredients._unique,
+            'map': ingredients._map,
+            'padded_from_origin': ingredients._padded_from_origin,
+        }
+        if SharedMemory is None:
+            return cls(None, [], owner=True, arrays=arrays)
+
+        layout, size = [], 0
+        for key, array in arrays.items():
+            layout.append((key, array.dtype.str, array.shape, size))
+            # arrays start at cache lines
+            size += -(-array.nbytes // 64) * 64
+
+        shared = cls(SharedMemory(create=True, size=max(size, 1)), layout, owner=True)
+        for key, array in arrays.items():
+            shared.arrays[key][...] = array
+            shared.arrays[key].flags.writeable = False
+        return shared
+
+    @classmethod
+    def attach(cls, descriptor):
+        name, layout = descriptor
+        if name is None:
+            return cls(None, [], arrays=layout)
+        shared = cls(SharedMemory(name=name), layout)
+        for array in shared.arrays.values():
+            array.flags.writeable = False
+        return shared
+
+    @property
+    def descriptor(self):
+        if self._shared_memory is None:
+            return (None, self.arrays)
+        return (self._shared_memory.name, self.layout)
+
+    def ingredients(self):
+        return Ingredients.from_arrays(
+            self.arrays['unique'], self.arrays['map'], self.arrays['padded_from_origin'])
+
+    def close(self):
+        '''
+        Detach from the block, which is also removed if it was created here.
+        '''
+
+        self.arrays = {}
+        if self._shared_memory is None:
+            return
+        try:
+            self._shared_memory.close()
+        except BufferError:
+            # ingredients made from the block are still alive, it is unmapped with them
+            pass
+        if self.owner:
+            self._shared_memory.unlink()
+
+def random_policy(game, random):
+    '''
+    Choose one of the actions that are allowed by the action mask.
+    '''
+
+    return ACTIONS[random.choice(np.flatnonzero(game.env['information']['action_mask']))]
+
+# state of a worker process, set once by _init_worker
+_worker = {}
+
+def _init_worker(descriptor, pizza_config, policy, max_steps):
+    shared = SharedIngredients.attach(descriptor)
+    _worker['shared'] = shared
+    _worker['pizza_config'] = dict(pizza_config, ingredients=shared.ingredients())
+    _worker['policy'] = policy
+    _worker['max_steps'] = max_steps
+
+def _play(seed):
+    '''
+    Play one game in the worker and return its records.
+    '''
+
+    game = Game({ 'max_steps': _worker['max_steps'], 'observation': 'numpy' })
+    game.init(_worker['pizza_config'])
+    policy = _worker['policy']
+    random = np.random.RandomState(seed)
+
+    records = np.zeros(1024, dtype=record_dtype)
+    steps = 0
+    while not game.env['done']:
+        game.step(policy(game, random))
+        if steps == len(records):
+            records = np.concatenate([records, np.zeros_like(records)])
+        fill_record(records[steps], game)
+        steps += 1
+    return seed, records[:steps]
+
+class Rollouts:
+    '''
+    Plays many games on the same pizza in a process pool. Ingredients are built
+    once and put into shared memory, workers attach to them when they start, so
+    memory of a worker grows only by the state of its own game. Every game comes
+    back as an array of records of record_dtype (see src/trajectory.py).
+
+    A policy is a picklable function policy(game, random) that returns the next
+    action, random is numpy RandomState seeded with the seed of the game.
+    '''
+
+    def __init__(self, pizza_config, workers=None, policy=random_policy, max_steps=1000):
+        ingredients = pizza_config.get('ingredients')
+        if ingredients is None:
+            ingredients = Ingredients(pizza_config['pizza_lines'])
+        self.shared = SharedIngredients.create(ingredients)
+        self.pizza_config = { key: pizza_config[key] for key in ['r', 'c', 'l', 'h'] }
+        self.workers = os.cpu_count() if workers is None else workers
+
+        initargs = (self.shared.descriptor, self.pizza_config, policy, max_steps)
+        if self.workers == 0:
+            _init_worker(*initargs)
+            self._executor = None
+        else:
+            self._executor = ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=initargs)
+
+    def run(self, seeds):
+        '''
+        Yield (seed, records) for a game with each of the seeds in the order of
+        completion, with not more than two games per worker in flight.
+        '''
+
+        if self._executor is None:
+            for seed in seeds:
+                yield _play(seed)
+            return
+
+        yield from map_unordered(self._executor, _play, seeds, 2*self.workers)
+
+    def game(self):
+        '''
+        Return a new game in this process on the shared ingredients.
+        '''
+
+        game = Game({})
+        game.init(dict(self.pizza_config, ingredients=self.shared.ingredients()))
+        return game
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+        if self.workers == 0:
+            _worker.clear()
+        self.shared.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+if __name__ == '__main__':
+    import argparse, sys, time
+    parser = argparse.ArgumentParser(description='Play many random games on one pizza in parallel')
+    parser.add_argument('input', nargs='?', default=None, help='pizza file, standard input by default')
+    parser.add_argument('--games', type=int, default=100, help='number of games to play')
+    parser.add_argument('--max_steps', type=int, default=1000, help='maximum steps of a game')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes, ' + \
+        'all cores by default, 0 to play in this process')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first game, next games get next seeds')
+    parser.add_argument('--output', default=None, help='folder where "<seed>/trajectory.bin" ' + \
+        'of every game is saved')
+    args = parser.parse_args()
+
+    pizza_config = load_pizza_config(sys.stdin.buffer if args.input is None else args.input)
+
+    start = time.time()
+    steps, score = 0, 0
+    with Rollouts(pizza_config, workers=args.workers, max_steps=args.max_steps) as rollouts:
+        game = rollouts.game() if args.output is not None else None
+        for seed, records in rollouts.run(range(args.seed, args.seed+args.games)):
+            steps += len(records)
+            score += int(records['score'][-1]) if len(records) > 0 else 0
+            if game is not None:
+                os.makedirs(os.path.join(args.output, str(seed)), exist_ok=True)
+                with TrajectoryWriter(os.path.join(args.output, str(seed), 'trajectory.bin'), game) as trajectory:
+                    trajectory.write_records(records)
+        del game
+    elapsed = time.time() - start
+
+    sys.stderr.write('Games: {}, steps: {}, mean score: {:.1f}, time: {:.2f}s, steps per second: {:.0f}\n'.format(
+        args.games, steps, score / max(args.games, 1), elapsed, steps / max(elapsed, 1e-9)))
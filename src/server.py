@@ -0,0 +1,317 @@
+from src.game import Game
+from src.ingredients import Ingredients
+
+from collections import deque
+import numpy as np
+import asyncio
+import hashlib
+import json
+import time
+
+def pizza_id_of(pizza_lines):
+    '''
+    Fingerprint of the pizza lines, the same pizzas get the same id.
+    '''
+
+    return hashlib.sha1('\n'.join(pizza_lines).encode()).hexdigest()
+
+def to_json(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(value).__name__))
+
+class ServerError(Exception):
+    pass
+
+class BatchError(ServerError):
+    '''
+    Error of a batch that stopped on a step, result has the rewards and the
+    number of the steps done before it.
+    '''
+
+    def __init__(self, message, result):
+        super().__init__(message)
+        self.result = result
+
+class Latency:
+    '''
+    Count and times of requests, percentiles are taken from the last ones.
+    '''
+
+    def __init__(self, last=1000):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = deque(maxlen=last)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.last.append(seconds)
+
+    def stats(self):
+        last = np.array(self.last) if len(self.last) > 0 else np.zeros(1)
+        return {
+            'requests': self.count,
+            'mean_us': 1e6 * self.total / max(self.count, 1),
+            'p50_us': 1e6 * float(np.percentile(last, 50)),
+            'p99_us': 1e6 * float(np.percentile(last, 99)),
+            'max_us': 1e6 * self.max,
+        }
+
+class Session:
+    def __init__(self, session_id, pizza_id, pizza_config, game_args):
+        self.id = session_id
+        self.pizza_id = pizza_id
+        self.pizza_config = pizza_config
+        self.game = Game(game_args)
+        self.latency = Latency()
+        self.steps = 0
+
+class GameServer:
+    '''
+    Hosts many games in one process and plays them on requests of a JSON-lines
+    protocol: every line is a request object with "op" and an optional "id",
+    which is returned in the response together with "ok" and the result or
+    "error".
+
+    Operations:
+        - create: new session with "pizza" (pizza config with "pizza_lines",
+          "l", "h") or "pizza_id" of a pizza already on the server, and optional
+          "max_steps", "observation" ("delta" by default), "window_size" and
+          "action_mode" (see Game),
+        - step: "action" in "session",
+        - batch_step: "actions" in "session" until the game is over; all actions
+          are checked before the first one is done, and if a step still fails,
+          the error comes with "rewards", "steps" and "env" of the steps done,
+        - reset: start the game of "session" again, steps of a session are
+          refused after its game is over until it is reset,
+        - slices: valid slices of "session",
+        - stats: latency of "session" or of all sessions,
+        - close: remove "session".
+
+    Sessions with the same pizza share one Ingredients, which is kept while
+    any of them is open. A connection is served one request at a time and
+    responses are written with drain, so a client that does not read its
+    responses is not read from either. Long batches give way to other
+    connections every batch_chunk steps.
+    '''
+
+    def __init__(self, max_sessions=1000, batch_chunk=1000):
+        self.max_sessions = max_sessions
+        self.batch_chunk = batch_chunk
+        self.sessions = {}
+        self.pizzas = {}
+        self.pizza_sessions = {}
+        self.next_session_id = 0
+        self.latency = Latency()
+
+    def session(self, request):
+        session = self.sessions.get(request.get('session'))
+        if session is None:
+            raise ServerError('Session {} is not found.'.format(request.get('session')))
+        return session
+
+    def pizza_config(self, request):
+        if 'pizza_id' in request:
+            pizza_id = request['pizza_id']
+            if pizza_id not in self.pizzas:
+                raise ServerError('Pizza {} is not found.'.format(pizza_id))
+            return pizza_id, self.pizzas[pizza_id]
+
+        pizza = request.get('pizza')
+        if pizza is None:
+            raise ServerError('Either "pizza" or "pizza_id" is required.')
+        pizza_lines = pizza['pizza_lines']
+        pizza_id = pizza_id_of(pizza_lines)
+        if pizza_id not in self.pizzas:
+            ingredients = Ingredients(pizza_lines)
+            self.pizzas[pizza_id] = {
+                'r': ingredients.shape[0], 'c': ingredients.shape[1],
+                'ingredients': ingredients, 'pizza_lines': pizza_lines }
+        return pizza_id, dict(self.pizzas[pizza_id], l=pizza['l'], h=pizza['h'])
+
+    def create(self, request):
+        if len(self.sessions) >= self.max_sessions:
+            raise ServerError('Too many sessions, the maximum is {}.'.format(self.max_sessions))
+        pizza_id, pizza_config = self.pizza_config(request)
+        if 'l' not in pizza_config:
+            pizza_config = dict(pizza_config, l=request['l'], h=request['h'])
+
+        game_args = { 'observation': request.get('observation', 'delta') }
+        for key in ['max_steps', 'window_size', 'action_mode']:
+            if request.get(key) is not None:
+                game_args[key] = request[key]
+        session = Session(self.next_session_id, pizza_id, pizza_config, game_args)
+        session.game.init(pizza_config)
+        self.next_session_id += 1
+        self.sessions[session.id] = session
+        self.pizza_sessions[pizza_id] = self.pizza_sessions.get(pizza_id, 0) + 1
+        return session, { 'session': session.id, 'pizza_id': pizza_id, 'env': self.env_of(session) }
+
+    def close(self, session):
+        del self.sessions[session.id]
+        self.pizza_sessions[session.pizza_id] -= 1
+        if self.pizza_sessions[session.pizza_id] == 0:
+            del self.pizza_sessions[session.pizza_id]
+            del self.pizzas[session.pizza_id]
+        return {}
+
+    def env_of(self, session):
+        '''
+        Last environment of the session without valid slices, they are returned
+        only by the "slices" operation.
+        '''
+
+        env = session.game.env
+        information = dict(env['information'])
+        del information['slices']
+        return dict(env, information=information)
+
+    def check_not_done(self, session):
+        if session.game.env['done']:
+            raise ServerError('Game of session {} is over, reset it to play again.'.format(session.id))
+
+    def step(self, session, request):
+        self.check_not_done(session)
+        session.game.step(request['action'])
+        session.steps += 1
+        return { 'env': self.env_of(session) }
+
+    async def batch_step(self, session, request):
+        self.check_not_done(session)
+        actions = request['actions']
+        for i, action in enumerate(actions):
+            try:
+                session.game.check_action(action)
+            except Exception as e:
+                raise ServerError('Action {} of the batch: {}'.format(i, e))
+
+        rewards = []
+        try:
+            for i, action in enumerate(actions):
+                if session.game.env['done']:
+                    break
+                rewards.append(session.game.step(action)[1])
+                if (i+1) % self.batch_chunk == 0:
+                    await asyncio.sleep(0)
+        except Exception as e:
+            raise BatchError('Action {} of the batch: {}: {}'.format(len(rewards), type(e).__name__, e),
+                { 'rewards': rewards, 'steps': len(rewards), 'env': self.env_of(session) })
+        finally:
+            session.steps += len(rewards)
+        return { 'rewards': rewards, 'steps': len(rewards), 'env': self.env_of(session) }
+
+    def reset(self, session):
+        session.game.init(session.pizza_config)
+        return { 'env': self.env_of(session) }
+
+    def stats(self, request):
+        if 'session' in request:
+            session = self.session(request)
+            return dict(session.latency.stats(), steps=session.steps)
+        return dict(self.latency.stats(),
+            sessions=len(self.sessions),
+            pizzas=len(self.pizzas),
+            session_stats={ session.id: dict(session.latency.stats(), steps=session.steps)
+                for session in self.sessions.values() })
+
+    async def handle(self, request):
+        '''
+        Return the response to the request.
+        '''
+
+        start = time.perf_counter()
+        session = None
+        try:
+            op = request.get('op')
+            if op == 'create':
+                session, result = self.create(request)
+            elif op == 'stats':
+                result = self.stats(request)
+            elif op in ['step', 'batch_step', 'reset', 'slices', 'close']:
+                session = self.session(request)
+                if op == 'step':
+                    result = self.step(session, request)
+                elif op == 'batch_step':
+                    result = await self.batch_step(session, request)
+                elif op == 'reset':
+                    result = self.reset(session)
+                elif op == 'slices':
+                    result = { 'slices': session.game.env['information']['slices'] }
+                else:
+                    result = self.close(session)
+            else:
+                raise ServerError('Operation \'{}\' is not recognised.'.format(op))
+            response = dict(result, ok=True)
+        except Exception as e:
+            response = { 'ok': False, 'error': '{}: {}'.format(type(e).__name__, e) }
+            if isinstance(e, BatchError):
+                response.update(e.result)
+
+        if 'id' in request:
+            response['id'] = request['id']
+        seconds = time.perf_counter() - start
+        self.latency.add(seconds)
+        if session is not None:
+            session.latency.add(seconds)
+        return response
+
+    async def serve_connection(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError('request is not an object')
+                except ValueError as e:
+                    response = { 'ok': False, 'error': 'Bad request: {}'.format(e) }
+                else:
+                    response = await self.handle(request)
+                writer.write(json.dumps(response, separators=(',',':'), default=to_json).encode() + b'\n')
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8765, unix=None, limit=1<<26):
+        '''
+        Serve connections on the unix socket at path unix or on TCP host and port
+        until cancelled. Limit is the maximum length of a request line.
+        '''
+
+        if unix is not None:
+            server = await asyncio.start_unix_server(self.serve_connection, unix, limit=limit)
+        else:
+            server = await asyncio.start_server(self.serve_connection, host, port, limit=limit)
+        async with server:
+            await server.serve_forever()
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Serve many games in one process over a JSON-lines protocol',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='\n' + \
+        ' Every line sent to the server is a JSON request, for example:\n' + \
+        '   {"id": 1, "op": "create", "pizza": {"pizza_lines": ["TTTTT", "TMMMT", "TTTTT"], "l": 1, "h": 6}}\n' + \
+        '   {"id": 2, "op": "step", "session": 0, "action": "toggle"}\n' + \
+        '   {"id": 3, "op": "batch_step", "session": 0, "actions": ["right", "down"]}\n' + \
+        ' and it answers with a JSON line with the same id (see GameServer for all operations).\n')
+    parser.add_argument('--host', default='127.0.0.1', help='host to listen on (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=8765, help='port to listen on (default: %(default)s)')
+    parser.add_argument('--unix', default=None, help='path of a unix socket to listen on instead of TCP')
+    parser.add_argument('--max_sessions', type=int, default=1000, help='maximum number of open sessions')
+    args = parser.parse_args()
+
+    server = GameServer(max_sessions=args.max_sessions)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
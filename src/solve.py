@@ -0,0 +1,382 @@
+from src.candidates import CandidateIndex, CACHE_DIR
+from src.game import load_pizza_config, write_slices
+from src.ingredients import Ingredients
+from src.validate import validate
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import os
+import time
+
+class Solver:
+    '''
+    Cuts the pizza without playing the game: valid rectangles from CandidateIndex
+    are placed greedily and then improved with local search until the time
+    budget is over.
+    '''
+
+    def __init__(self, pizza_config, seed=None, cache_dir=CACHE_DIR):
+        self.ingredients = pizza_config.get('ingredients')
+        if self.ingredients is None:
+            self.ingredients = Ingredients(pizza_config['pizza_lines'])
+        self.r, self.c = self.ingredients.shape
+        self.l, self.h = pizza_config['l'], pizza_config['h']
+        self.random = np.random.RandomState(seed)
+
+        self.candidates = CandidateIndex.load(self.ingredients, self.l, self.h, cache_dir)
+        self.shapes = self.candidates.shapes.tolist()
+        self.owner = np.full((self.r,self.c), -1, dtype=np.int32)
+        self.slices = {}
+        self.next_slice_id = 0
+        self.score = 0
+
+    def add(self, r0, c0, r1, c1):
+        slice_id = self.next_slice_id
+        self.next_slice_id += 1
+        self.put(slice_id, (r0, c0, r1, c1))
+        return slice_id
+
+    def put(self, slice_id, bounds):
+        r0, c0, r1, c1 = bounds
+        self.slices[slice_id] = bounds
+        self.owner[r0:r1+1, c0:c1+1] = slice_id
+        self.score += (r1-r0+1) * (c1-c0+1)
+
+    def remove(self, slice_id):
+        r0, c0, r1, c1 = self.slices.pop(slice_id)
+        self.owner[r0:r1+1, c0:c1+1] = -1
+        self.score -= (r1-r0+1) * (c1-c0+1)
+
+    def is_free(self, r0, c0, r1, c1):
+        return r0 >= 0 and c0 >= 0 and r1 < self.r and c1 < self.c and \
+            not np.any(self.owner[r0:r1+1, c0:c1+1] != -1)
+
+    def greedy(self):
+        '''
+        Go through the cells row by row and cut the biggest valid slice that starts
+        in the cell. Slices cut before start in earlier rows, so a rectangle is free
+        if nothing covers its first row, which is kept as the last covered row
+        of each column.
+        '''
+
+        indptr, indices = self.candidates.indptr.tolist(), self.candidates.indices.tolist()
+        last_covered_row = [-1] * self.c
+        for r in range(self.r):
+            for c in range(self.c):
+                if last_covered_row[c] >= r:
+                    continue
+                i = r*self.c+c
+                for shape in indices[indptr[i]:indptr[i+1]]:
+                    height, width = self.shapes[shape]
+                    if max(last_covered_row[c:c+width]) < r:
+                        self.add(r, c, r+height-1, c+width-1)
+                        last_covered_row[c:c+width] = [r+height-1] * width
+                        break
+
+    def grow(self, slice_ids=None):
+        '''
+        Increase slices into free cells around them while they fit the maximum.
+        Slices stay valid, because ingredients only get added.
+        '''
+
+        for slice_id in list(self.slices if slice_ids is None else slice_ids):
+            if slice_id not in self.slices:
+                continue
+            changed = True
+            while changed:
+                changed = False
+                r0, c0, r1, c1 = self.slices[slice_id]
+                for side in [(r0,c1+1,r1,c1+1), (r1+1,c0,r1+1,c1), (r0,c0-1,r1,c0-1), (r0-1,c0,r0-1,c1)]:
+                    bounds = min(r0,side[0]), min(c0,side[1]), max(r1,side[2]), max(c1,side[3])
+                    if (bounds[2]-bounds[0]+1) * (bounds[3]-bounds[1]+1) <= self.h and self.is_free(*side):
+                        self.remove(slice_id)
+                        self.put(slice_id, bounds)
+                        changed = True
+                        break
+
+    def repair(self, r0, c0, r1, c1, biggest_first=False):
+        '''
+        Cut slices again inside the window: remove the slices that are inside it
+        and fill its free cells with valid slices, preferring shapes in a random
+        order or the biggest shapes if biggest_first. Changes are kept only if
+        the score does not decrease.
+        '''
+
+        score, first_added = self.score, self.next_slice_id
+        window = self.owner[r0:r1+1, c0:c1+1]
+        removed = {}
+        for slice_id in np.unique(window[window != -1]).tolist():
+            bounds = self.slices[slice_id]
+            if bounds[0] >= r0 and bounds[1] >= c0 and bounds[2] <= r1 and bounds[3] <= c1:
+                removed[slice_id] = bounds
+                self.remove(slice_id)
+
+        rank = None if biggest_first else self.random.permutation(len(self.shapes))
+        for r in range(r0, r1+1):
+            for c in range(c0, c1+1):
+                if self.owner[r,c] != -1:
+                    continue
+                shapes = self.candidates.shapes_at(r, c)
+                if rank is not None:
+                    shapes = shapes[np.argsort(rank[shapes])]
+                for shape in shapes.tolist():
+                    height, width = self.shapes[shape]
+                    if self.is_free(r, c, r+height-1, c+width-1):
+                        self.add(r, c, r+height-1, c+width-1)
+                        break
+        self.grow(range(first_added, self.next_slice_id))
+
+        if self.score < score:
+            for slice_id in range(first_added, self.next_slice_id):
+                self.remove(slice_id)
+            for slice_id, bounds in removed.items():
+                self.put(slice_id, bounds)
+
+    def improve(self, deadline):
+        '''
+        Repair random windows around free cells until the deadline.
+        '''
+
+        size = max(2, 2*int(np.ceil(np.sqrt(self.h))))
+        while time.time() < deadline:
+            free = np.argwhere(self.owner == -1)
+            if len(free) == 0:
+                return
+            for r, c in free[self.random.randint(0, len(free), min(len(free), 100))]:
+                if time.time() >= deadline:
+                    return
+                height, width = self.random.randint(size, 2*size+1, 2)
+                r0, c0 = max(0, r-self.random.randint(height)), max(0, c-self.random.randint(width))
+                self.repair(r0, c0, min(self.r-1, r0+height-1), min(self.c-1, c0+width-1))
+
+    def solve(self, time_budget):
+        deadline = time.time() + time_budget
+        self.greedy()
+        self.grow()
+        self.improve(deadline)
+        return sorted(self.slices.values())
+
+def tiles_of(r, c, size, margin):
+    '''
+    Split the pizza into tiles with cores of size x size cells. Return a list of
+    (core, area) bounds of the tiles, where the area is the core with margin more
+    rows below it and margin more columns to the right of it inside the pizza,
+    so areas of neighbouring tiles overlap.
+    '''
+
+    tiles = []
+    for r0 in range(0, r, size):
+        for c0 in range(0, c, size):
+            r1, c1 = min(r0+size, r)-1, min(c0+size, c)-1
+            tiles.append(((r0, c0, r1, c1), (r0, c0, min(r1+margin, r-1), min(c1+margin, c-1))))
+    return tiles
+
+# state of a worker process, set once by _init_tile_worker
+_tile_worker = {}
+
+def _init_tile_worker(descriptor, l, h):
+    from src.rollout import SharedIngredients
+    shared = SharedIngredients.attach(descriptor)
+    _tile_worker['shared'] = shared
+    _tile_worker['ingredients'] = shared.ingredients()
+    _tile_worker['l'], _tile_worker['h'] = l, h
+
+def _solve_tile(index, area, seed, time_budget):
+    '''
+    Solve the area of a tile in the worker and return the index of the tile and
+    the slices in the coordinates of the pizza.
+    '''
+
+    r0, c0, r1, c1 = area
+    ingredients = _tile_worker['ingredients'].sub(r0, c0, r1, c1)
+    solver = Solver({ 'ingredients': ingredients, 'l': _tile_worker['l'], 'h': _tile_worker['h'] },
+        seed=seed, cache_dir=None)
+    slices = np.array(solver.solve(time_budget), dtype=np.int64).reshape((-1,4))
+    return index, slices + (r0, c0, r0, c0)
+
+class TiledSolver:
+    '''
+    Solves a big pizza in tiles in a process pool. Cores of the tiles split the
+    pizza, and every tile is solved on the area of its core with H-1 more rows and
+    columns, so that any slice with the top left corner in the core fits.
+    Ingredients are put into shared memory once and every worker solves its tiles
+    on views of them (see Ingredients.sub).
+
+    Only slices with the top left corner in the core of their tile are kept, so
+    slices near the seams can overlap slices of the next tiles. Slices inside the
+    cores are placed first, then the rest from the biggest one while they do not
+    overlap, and the gaps left along the seams are filled by repairs of windows
+    on the whole pizza with Solver, cutting the biggest slices first.
+    '''
+
+    def __init__(self, pizza_config, tile_size=16, workers=None, seed=None, cache_dir=CACHE_DIR):
+        self.ingredients = pizza_config.get('ingredients')
+        if self.ingredients is None:
+            self.ingredients = Ingredients(pizza_config['pizza_lines'])
+        self.r, self.c = self.ingredients.shape
+        self.l, self.h = pizza_config['l'], pizza_config['h']
+        self.seed = seed
+        self.cache_dir = cache_dir
+        self.workers = os.cpu_count() if workers is None else workers
+
+        self.size = max(1, tile_size*self.h)
+        self.tiles = tiles_of(self.r, self.c, self.size, self.h-1)
+        self.score = 0
+
+        # only tiled solving needs shared ingredients and the pool of rollouts
+        from src.rollout import SharedIngredients
+        self.shared = SharedIngredients.create(self.ingredients)
+        initargs = (self.shared.descriptor, self.l, self.h)
+        if self.workers == 0:
+            _init_tile_worker(*initargs)
+            self._executor = None
+        else:
+            self._executor = ProcessPoolExecutor(self.workers, initializer=_init_tile_worker, initargs=initargs)
+
+    def solve_tiles(self, time_budget):
+        '''
+        Start solving all tiles and return an iterator that waits for them and
+        gives (index, slices) of every tile in the order of completion. Tiles are
+        solved in waves of one tile per worker, every tile gets its part of the
+        time budget.
+        '''
+
+        waves = -(-len(self.tiles) // max(self.workers, 1))
+        tile_budget = time_budget / waves
+        seeds = [None if self.seed is None else self.seed + i for i in range(len(self.tiles))]
+
+        if self._executor is None:
+            return (_solve_tile(i, area, seeds[i], tile_budget)
+                for i, (core, area) in enumerate(self.tiles))
+
+        futures = [self._executor.submit(_solve_tile, i, area, seeds[i], tile_budget)
+            for i, (core, area) in enumerate(self.tiles)]
+        return (future.result() for future in as_completed(futures))
+
+    def merge(self, solver, tile_slices):
+        '''
+        Put slices of the tiles into the solver. Slices inside the cores never
+        overlap, so they are put first, then the slices that cross into the cores
+        of the next tiles from the biggest one, if they do not overlap slices
+        already put.
+        '''
+
+        crossing = []
+        for i, slices in tile_slices:
+            r0, c0, r1, c1 = self.tiles[i][0]
+            slices = slices[(slices[:,0] <= r1) & (slices[:,1] <= c1)]
+            inside = (slices[:,2] <= r1) & (slices[:,3] <= c1)
+            for bounds in slices[inside].tolist():
+                solver.add(*bounds)
+            crossing.append(slices[~inside])
+
+        crossing = np.concatenate(crossing) if len(crossing) > 0 else np.zeros((0,4), dtype=np.int64)
+        area = (crossing[:,2]-crossing[:,0]+1) * (crossing[:,3]-crossing[:,1]+1)
+        for bounds in crossing[np.argsort(-area, kind='stable')].tolist():
+            if solver.is_free(*bounds):
+                solver.add(*bounds)
+
+    def seam_windows(self):
+        '''
+        Return bounds of windows of 4H x 8H cells centered on the seams between
+        the tiles, every next window along a seam is shifted by 4H.
+        '''
+
+        h = self.h
+        windows = []
+        for seam in range(self.size, self.r, self.size):
+            windows += [(max(seam-2*h, 0), c, min(seam+2*h, self.r)-1, min(c+8*h, self.c)-1)
+                for c in range(0, self.c, 4*h)]
+        for seam in range(self.size, self.c, self.size):
+            windows += [(r, max(seam-2*h, 0), min(r+8*h, self.r)-1, min(seam+2*h, self.c)-1)
+                for r in range(0, self.r, 4*h)]
+        return windows
+
+    def solve(self, time_budget, tiles_part=0.7):
+        '''
+        Solve the tiles in tiles_part of the time budget, then merge them and fill
+        the seams, and improve the whole pizza in the rest of the time. The result
+        is validated before it is returned.
+        '''
+
+        deadline = time.time() + time_budget
+        tile_slices = self.solve_tiles(tiles_part*time_budget)
+        # the index of the whole pizza is built while the workers solve tiles
+        solver = Solver({ 'ingredients': self.ingredients, 'l': self.l, 'h': self.h },
+            seed=self.seed, cache_dir=self.cache_dir)
+        self.merge(solver, tile_slices)
+
+        for r0, c0, r1, c1 in self.seam_windows():
+            if time.time() >= deadline:
+                break
+            if np.any(solver.owner[r0:r1+1, c0:c1+1] == -1):
+                solver.repair(r0, c0, r1, c1, biggest_first=True)
+        solver.improve(deadline)
+
+        slices = sorted(solver.slices.values())
+        result = validate(self.ingredients, self.l, self.h, slices)
+        if not result['valid']:
+            raise RuntimeError('Slices of the tiles are not valid: {}'.format(
+                { violation: len(indices) for violation, indices in result['violations'].items() }))
+        self.score = result['score']
+        return slices
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+        _tile_worker.clear()
+        self.shared.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+if __name__ == '__main__':
+    import argparse, sys
+    parser = argparse.ArgumentParser(description='Cut the pizza with a greedy solver and local search',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='\n' + \
+        ' Reads the pizza in the format of Hash Code input and writes the slices in the\n' + \
+        ' same format as --output of the game. The score and the speed of the solver\n' + \
+        ' are printed to the standard error.\n')
+    parser.add_argument('input', nargs='?', default=None, help='pizza file, standard input by default')
+    parser.add_argument('--output', default=None, help='a path where to store slices, standard output by default')
+    parser.add_argument('--time_budget', type=float, default=10, help='seconds to spend on the solution')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the local search')
+    parser.add_argument('--cache_dir', default=CACHE_DIR, help='folder where valid slices ' + \
+        'of the pizzas are cached (default: %(default)s)')
+    parser.add_argument('--no_cache', action='store_true', help='do not cache valid slices')
+    parser.add_argument('--tiled', action='store_true', help='solve tiles of the pizza in parallel ' + \
+        'and merge them, for big pizzas')
+    parser.add_argument('--tile_size', type=int, default=16, help='side of a tile in multiples of H ' + \
+        '(default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes for --tiled, ' + \
+        'all cores by default, 0 to solve in this process')
+    parser.add_argument('--quiet', action='store_true', help='do not print the score')
+    args = parser.parse_args()
+
+    start = time.time()
+    pizza_config = load_pizza_config(sys.stdin.buffer if args.input is None else args.input)
+
+    cache_dir = None if args.no_cache else args.cache_dir
+    if args.tiled:
+        with TiledSolver(pizza_config, tile_size=args.tile_size, workers=args.workers,
+            seed=args.seed, cache_dir=cache_dir) as solver:
+            slices = solver.solve(args.time_budget - (time.time()-start))
+    else:
+        solver = Solver(pizza_config, seed=args.seed, cache_dir=cache_dir)
+        slices = solver.solve(args.time_budget - (time.time()-start))
+    elapsed = time.time() - start
+
+    if args.output is None:
+        write_slices(sys.stdout, slices)
+    else:
+        with open(args.output, 'w') as f:
+            write_slices(f, slices)
+
+    if not args.quiet:
+        total = solver.r*solver.c
+        sys.stderr.write('Score: {} of {} ({:.2f}%), slices: {}, time: {:.2f}s, score per second: {:.0f}\n'.format(
+            solver.score, total, 100*solver.score/total, len(slices), elapsed, solver.score/elapsed))
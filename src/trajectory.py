@@ -0,0 +1,255 @@
+from src.google_engineer import ACTIONS
+from src.ingredients import Ingredients
+from src.pizza import Slice
+from src.profiler import profiler
+from src.valid_slices import ValidSlices
+
+import numpy as np
+import json
+import os
+import time
+
+MAGIC = b'PIZZATRJ'
+VERSION = 1
+
+# one record for each step; rect is the slice cut by the action or -1 if none
+record_dtype = np.dtype([
+    ('step',       '<i4'),
+    ('action',     'u1'),
+    ('slice_mode', 'u1'),
+    ('done',       'u1'),
+    ('reward',     '<f8'),
+    ('cursor',     '<i4', (2,)),
+    ('rect',       '<i4', (4,)),
+    ('score',      '<i4'),
+    ('frontier',   '<i4'),
+])
+
+def fill_record(record, game):
+    '''
+    Write the last step of the game into the record.
+    '''
+
+    env = game.env
+    changed_slice = game.google_engineer.changed_slice
+
+    record['step'] = env['information']['step']
+    record['action'] = ACTIONS.index(env['information']['action'])
+    record['slice_mode'] = game.google_engineer.slice_mode
+    record['done'] = env['done']
+    record['reward'] = env['reward']
+    record['cursor'] = game.google_engineer.cursor_position
+    record['rect'] = changed_slice.as_tuple if changed_slice is not None else (-1,-1,-1,-1)
+    record['score'] = env['information']['score']
+    record['frontier'] = env['information']['frontier']
+
+class TrajectoryWriter:
+    '''
+    Writes a game into one binary file: a header with the pizza followed by
+    a fixed-width record for each step. Records are appended to a buffered file,
+    so writing a step costs no more than packing a few numbers.
+
+    File layout:
+        - 8 bytes of MAGIC,
+        - little-endian uint32 length of the header,
+        - header as JSON padded with spaces to a multiple of 8 bytes,
+        - records of record_dtype until the end of the file.
+    '''
+
+    def __init__(self, path, game):
+        if game.action_mode != 'step':
+            raise ValueError('Only games in "step" action mode can be recorded, ' + \
+                'a record has no room for actions of "{}" mode.'.format(game.action_mode))
+        self.path = path
+        self._file = open(path, 'wb')
+
+        google_engineer = game.google_engineer
+        header = json.dumps({
+            'version': VERSION,
+            'r': google_engineer.pizza.r,
+            'c': google_engineer.pizza.c,
+            'l': google_engineer.min_each_ingredient_per_slice,
+            'h': google_engineer.max_ingredients_per_slice,
+            'unique_ingredients': game.unique_ingredients,
+            'frontier': game.env['information']['frontier'],
+            'pizza_lines': google_engineer.pizza.ingredients.as_lines(),
+        }, separators=(',',':')).encode()
+        header += b' ' * (-(len(MAGIC)+4+len(header)) % 8)
+
+        self._file.write(MAGIC)
+        self._file.write(np.array(len(header), dtype='<u4').tobytes())
+        self._file.write(header)
+        self._record = np.zeros(1, dtype=record_dtype)
+
+    def write(self, game):
+        '''
+        Append the last step of the game.
+        '''
+
+        if profiler.enabled:
+            start = time.perf_counter()
+
+        fill_record(self._record[0], game)
+        self._file.write(self._record.tobytes())
+        if profiler.enabled:
+            profiler.add('record', start)
+
+    def write_records(self, records):
+        '''
+        Append records of record_dtype, for example the ones of a game played elsewhere.
+        '''
+
+        self._file.write(np.asarray(records, dtype=record_dtype).tobytes())
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class TrajectoryReader:
+    '''
+    Reads a file written by TrajectoryWriter. Records are memory-mapped, and
+    environments of any step are rebuilt in the same form as Game returns them
+    with "dict" observation.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError('File \'{}\' is not a pizza trajectory.'.format(path))
+            header_length = int(np.frombuffer(f.read(4), dtype='<u4')[0])
+            self.header = json.loads(f.read(header_length).decode())
+
+        self.r, self.c = self.header['r'], self.header['c']
+        self.l, self.h = self.header['l'], self.header['h']
+        self.unique_ingredients = self.header['unique_ingredients']
+        self.pizza_lines = self.header['pizza_lines']
+
+        offset = len(MAGIC)+4+header_length
+        if os.path.getsize(path) - offset >= record_dtype.itemsize:
+            # a record that was not written completely is left out
+            self.records = np.memmap(path, dtype=record_dtype, mode='r', offset=offset,
+                shape=((os.path.getsize(path) - offset) // record_dtype.itemsize,))
+        else:
+            self.records = np.zeros(0, dtype=record_dtype)
+
+        self._ingredients = None
+
+    @property
+    def ingredients(self):
+        if self._ingredients is None:
+            self._ingredients = Ingredients(self.pizza_lines)
+        return self._ingredients
+
+    def __len__(self):
+        '''
+        Number of environments: the initial one and one after each step.
+        '''
+
+        return len(self.records) + 1
+
+    def env(self, step):
+        '''
+        Return the environment after the specified step, 0 is the initial one.
+        '''
+
+        if step < 0:
+            step += len(self)
+        if not 0 <= step < len(self):
+            raise IndexError('Step {} is not in the trajectory.'.format(step))
+        return next(self.envs(step, first_step=step))
+
+    def slices_maps(self):
+        '''
+        Return array of slices maps of all environments, the first one is the initial.
+        '''
+
+        slices_maps = np.empty((len(self),self.r,self.c), dtype=np.int32)
+        slices_maps[0] = -1
+        for step, (r0, c0, r1, c1) in enumerate(self.records['rect'].tolist(), 1):
+            slices_maps[step] = slices_maps[step-1]
+            if r0 != -1:
+                slices_maps[step, r0:r1+1, c0:c1+1] = r0*self.c+c0
+        return slices_maps
+
+    def envs(self, last_step=None, first_step=0):
+        '''
+        Yield environments from first_step to last_step, 0 is the initial one. The
+        slices map is updated only with the rectangles cut on the way, and it is
+        copied into a list only for the environments that are yielded.
+
+        Environments have no "action_mask" of Game, because the can increase flags
+        it is made of are not recorded; replay the actions with GoogleEngineer to
+        get it.
+        '''
+
+        last_step = len(self)-1 if last_step is None else last_step
+        slices_map = np.full((self.r,self.c), -1)
+        valid_slices = ValidSlices(self.c)
+
+        state = {
+            'ingredients_map': self.ingredients._map.tolist(),
+            'slices_map': None,
+            'cursor_position': (0,0),
+            'slice_mode': False,
+            'min_each_ingredient_per_slice': self.l,
+            'max_ingredients_per_slice': self.h,
+        }
+        if first_step == 0:
+            state['slices_map'] = slices_map.tolist()
+            yield {
+                'state': state,
+                'reward': 0,
+                'done': False,
+                'information': {
+                    'step': 0,
+                    'action': 'none',
+                    'unique_ingredients': self.unique_ingredients,
+                    'score': 0,
+                    'frontier': self.header['frontier'],
+                    'slices': []}}
+
+        for step, record in enumerate(self.records[:last_step], 1):
+            r0, c0, r1, c1 = record['rect'].tolist()
+            if r0 != -1:
+                slice = Slice(r0, c0, r1, c1)
+                if min(self.ingredients.of(slice)) >= self.l:
+                    old_slice_ids = np.unique(slices_map[r0:r1+1, c0:c1+1])
+                    for slice_id in old_slice_ids[old_slice_ids != -1].tolist():
+                        valid_slices.discard(slice_id)
+                    valid_slices.add(slice)
+                slices_map[r0:r1+1, c0:c1+1] = r0*self.c+c0
+                state = dict(state, slices_map=None)
+            if step < first_step:
+                continue
+
+            if state['slices_map'] is None:
+                state['slices_map'] = slices_map.tolist()
+            state = dict(state,
+                cursor_position=tuple(record['cursor'].tolist()),
+                slice_mode=bool(record['slice_mode']))
+            yield {
+                'state': state,
+                'reward': float(record['reward']),
+                'done': bool(record['done']),
+                'information': {
+                    'step': int(record['step']),
+                    'action': ACTIONS[record['action']],
+                    'unique_ingredients': self.unique_ingredients,
+                    'score': int(record['score']),
+                    'frontier': int(record['frontier']),
+                    'slices': valid_slices.as_tuples()}}
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Print an environment from a pizza trajectory file as JSON')
+    parser.add_argument('path', help='trajectory file written with --name')
+    parser.add_argument('--step', type=int, default=-1, help='step of the environment, last one by default')
+    args = parser.parse_args()
+
+    print(json.dumps(TrajectoryReader(args.path).env(args.step), separators=(',',':')))
@@ -0,0 +1,78 @@
+from src.pizza import Slice
+
+from bisect import bisect_left, insort
+
+class ValidSlices:
+    '''
+    Collection of valid slices keyed by slice id (r0*c+c0, same as in Pizza).
+    Bounds of the slices are kept sorted all the time, so there is no need to
+    sort slices after every action.
+    '''
+
+    def __init__(self, c):
+        self.c = c
+        self._dict = {}
+        self._sorted = []
+        self._tuple = ()
+
+    def id_of(self, slice):
+        return slice.r0*self.c+slice.c0
+
+    def __len__(self):
+        return len(self._dict)
+
+    def __contains__(self, slice):
+        return self._dict.get(self.id_of(slice)) == slice.as_tuple
+
+    def __iter__(self):
+        '''
+        Iterate over slices sorted by their bounds.
+        '''
+
+        for bounds in self.as_tuples():
+            yield Slice(*bounds)
+
+    def _before_change(self):
+        # the tuple given away is built again only when it is asked for
+        self._tuple = None
+
+    def add(self, slice):
+        self._add(slice.as_tuple)
+
+    def _add(self, bounds):
+        self._before_change()
+        self._dict[bounds[0]*self.c+bounds[1]] = bounds
+        insort(self._sorted, bounds)
+
+    def discard(self, slice_id):
+        bounds = self._dict.pop(slice_id, None)
+        if bounds is not None:
+            self._before_change()
+            del self._sorted[bisect_left(self._sorted, bounds)]
+
+    def remove(self, slice):
+        if slice not in self:
+            raise KeyError(slice.as_tuple)
+        self.discard(self.id_of(slice))
+
+    def bounds_of(self, slice_id):
+        return self._dict.get(slice_id)
+
+    def restore(self, slice_id, bounds):
+        '''
+        Put back bounds of the slice with the id, or remove it if bounds are None.
+        '''
+
+        self.discard(slice_id)
+        if bounds is not None:
+            self._add(bounds)
+
+    def as_tuples(self):
+        '''
+        Return sorted tuple of bounds (r0, c0, r1, c1) of the slices. The tuple is
+        built once after a change of the slices and shared until the next one.
+        '''
+
+        if self._tuple is None:
+            self._tuple = tuple(self._sorted)
+        return self._tuple
@@ -0,0 +1,120 @@
+from src.game import load_pizza_config
+
+import numpy as np
+
+def read_slices(f):
+    '''
+    Read slices in the format of Hash Code output at once. Return array of
+    shape (S,4) with r0, c0, r1, c1 of each slice.
+    '''
+
+    numbers = f.read().split()
+    if len(numbers) == 0:
+        raise ValueError('Number of slices is missing.')
+    numbers = np.array(numbers, dtype=np.int64)
+    if len(numbers) != 1 + 4*numbers[0]:
+        raise ValueError('Expected {} slices of 4 numbers, but found {} numbers after the first line.'.format(
+            numbers[0], len(numbers)-1))
+    return numbers[1:].reshape((-1,4))
+
+def rectangle_sums(padded, r0, c0, r1, c1):
+    return padded[r1+1,c1+1] - padded[r0,c1+1] - padded[r1+1,c0] + padded[r0,c0]
+
+def validate(ingredients, l, h, slices):
+    '''
+    Check all slices at once. Rows and columns of a slice can be in any order.
+    Return a dict with:
+        - valid: True if no slice has a violation,
+        - score: number of cells in the slices if valid, otherwise 0,
+        - slices: slices with r0 <= r1 and c0 <= c1,
+        - violations: for each kind of violation, indices of the slices with it:
+            - out_of_pizza: not inside the pizza,
+            - overlap: has cells of other slices,
+            - too_big: more than H cells,
+            - too_few_ingredients: less than L of some ingredient.
+    '''
+
+    slices = np.asarray(slices, dtype=np.int64).reshape((-1,4))
+    r0, r1 = np.minimum(slices[:,0], slices[:,2]), np.maximum(slices[:,0], slices[:,2])
+    c0, c1 = np.minimum(slices[:,1], slices[:,3]), np.maximum(slices[:,1], slices[:,3])
+    r, c = ingredients.shape
+
+    inside = (r0 >= 0) & (c0 >= 0) & (r1 < r) & (c1 < c)
+    # slices outside of the pizza are checked as empty ones at the origin
+    r0, c0 = np.where(inside, r0, 0), np.where(inside, c0, 0)
+    r1, c1 = np.where(inside, r1, -1), np.where(inside, c1, -1)
+    area = (r1-r0+1) * (c1-c0+1)
+
+    # number of slices on every cell from a difference array
+    ones = inside.astype(np.int32)
+    coverage = np.zeros((r+1,c+1), dtype=np.int32)
+    np.add.at(coverage, (r0, c0), ones)
+    np.add.at(coverage, (r0, c1+1), -ones)
+    np.add.at(coverage, (r1+1, c0), -ones)
+    np.add.at(coverage, (r1+1, c1+1), ones)
+    coverage = coverage.cumsum(axis=0).cumsum(axis=1)[:r,:c]
+
+    overlapping = np.zeros((r+1,c+1), dtype=np.int32)
+    np.cumsum(coverage > 1, axis=0, out=overlapping[1:,1:])
+    np.cumsum(overlapping[1:,1:], axis=1, out=overlapping[1:,1:])
+    overlap = inside & (rectangle_sums(overlapping, r0, c0, r1, c1) > 0)
+
+    too_big = inside & (area > h)
+    too_few_ingredients = inside & \
+        (ingredients.of_many(np.stack([r0, c0, r1, c1], axis=1)).min(axis=1) < l)
+
+    violations = {
+        'out_of_pizza': np.flatnonzero(~inside),
+        'overlap': np.flatnonzero(overlap),
+        'too_big': np.flatnonzero(too_big),
+        'too_few_ingredients': np.flatnonzero(too_few_ingredients),
+    }
+    valid = all(len(indices) == 0 for indices in violations.values())
+    return {
+        'valid': valid,
+        'score': int(area.sum()) if valid else 0,
+        'slices': np.stack([r0, c0, r1, c1], axis=1),
+        'violations': violations,
+    }
+
+def violations_of_slices(result):
+    '''
+    Return dict from index of a slice to the list of its violations.
+    '''
+
+    slice_violations = {}
+    for violation, indices in result['violations'].items():
+        for index in indices.tolist():
+            slice_violations.setdefault(index, []).append(violation)
+    return dict(sorted(slice_violations.items()))
+
+if __name__ == '__main__':
+    import argparse, sys, time
+    parser = argparse.ArgumentParser(description='Validate and score slices of a pizza in the format of Hash Code output')
+    parser.add_argument('input', help='pizza file in the format of Hash Code input')
+    parser.add_argument('output', help='slices file, for example written with --output of the game')
+    parser.add_argument('--max_violations', type=int, default=20, help='maximum number of slices ' + \
+        'with violations to print')
+    args = parser.parse_args()
+
+    start = time.time()
+    pizza_config = load_pizza_config(args.input)
+    ingredients = pizza_config['ingredients']
+    with open(args.output) as f:
+        slices = read_slices(f)
+    loaded = time.time()
+    result = validate(ingredients, pizza_config['l'], pizza_config['h'], slices)
+    elapsed = time.time() - loaded
+
+    slice_violations = violations_of_slices(result)
+    for index, violations in list(slice_violations.items())[:args.max_violations]:
+        print('Slice {} ({} {} {} {}): {}'.format(index, *slices[index], ', '.join(violations)))
+    if len(slice_violations) > args.max_violations:
+        print('... and {} more slices with violations'.format(len(slice_violations) - args.max_violations))
+
+    total = ingredients.total
+    print('{}, score: {} of {} ({:.2f}%), slices: {}, slices with violations: {}'.format(
+        'Valid' if result['valid'] else 'Invalid', result['score'], total, 100*result['score']/total,
+        len(slices), len(slice_violations)))
+    print('Time of loading: {:.3f}s, validation: {:.3f}s'.format(loaded - start, elapsed))
+    sys.exit(0 if result['valid'] else 1)
@@ -0,0 +1,289 @@
+from src.google_engineer import ACTIONS, ActionNotFoundException, \
+    POSITIVE_REWARD, NEUTRAL_REWARD, NEGATIVE_REWARD
+from src.ingredients import Ingredients, count_dtype, signed_dtype
+from src.pizza import Direction, Slice, FLAG_BITS, OPPOSITE, UNPACK_FLAGS, initial_flags
+
+import numpy as np
+
+TOGGLE = ACTIONS.index('toggle')
+
+class VectorGame:
+    '''
+    Many games played in lockstep. The state of all pizzas is kept in stacked
+    arrays padded to the biggest pizza, so one step applies an action to every
+    pizza at once. Rewards, scores and game over are the same as for GoogleEngineer
+    playing each pizza separately. Finished games are reset automatically.
+    Arrays have the same compact types as in Pizza, chosen by the biggest pizza.
+
+    Actions are indices in ACTIONS: directions by their value and toggle last.
+    '''
+
+    delta_position = np.array([
+        (0,1),   # right
+        (1,0),   # down
+        (0,-1),  # left
+        (-1,0),  # up
+    ])
+
+    delta_increase_slice = np.array([
+        (0,0,0,1),   # right
+        (0,0,1,0),   # down
+        (0,-1,0,0),  # left
+        (-1,0,0,0),  # up
+    ])
+
+    def __init__(self, args):
+        self.max_steps = args.get('max_steps', float('inf'))
+
+    def init(self, pizza_configs):
+        self.pizza_configs = list(pizza_configs)
+        self.n = len(self.pizza_configs)
+        ingredients = [Ingredients(config['pizza_lines']) if config.get('ingredients') is None
+            else config['ingredients'] for config in self.pizza_configs]
+
+        self.r = np.array([i.shape[0] for i in ingredients])
+        self.c = np.array([i.shape[1] for i in ingredients])
+        self.l = np.array([config['l'] for config in self.pizza_configs])
+        self.h = np.array([config['h'] for config in self.pizza_configs])
+        self.unique_ingredients = [i._unique.tolist() for i in ingredients]
+
+        r, c = self.r.max(), self.c.max()
+        total_unique = max(i.total_unique for i in ingredients)
+
+        self.ingredients_map = np.full((self.n,r,c), -1, dtype=signed_dtype(total_unique))
+        self._padded_from_origin = np.zeros((self.n,r+1,c+1,total_unique), dtype=count_dtype(r*c))
+        self._present = np.zeros((self.n,total_unique), dtype=bool)
+        for n, i in enumerate(ingredients):
+            self.ingredients_map[n,:self.r[n],:self.c[n]] = i._map
+            self._padded_from_origin[n,:self.r[n]+1,:self.c[n]+1,:i.total_unique] = \
+                i._padded_from_origin
+            self._present[n,:i.total_unique] = True
+
+        self.slices_map = np.full((self.n,r,c), -1, dtype=signed_dtype(r*c))
+        self._corner = np.zeros((self.n,r,c,2), dtype=signed_dtype(max(r, c)))
+        self._can_increase = np.zeros((self.n,r,c), dtype=np.uint8)
+        self.cursor_position = np.zeros((self.n,2), dtype=np.int64)
+        self.slice_mode = np.zeros(self.n, dtype=bool)
+        self.score = np.zeros(self.n, dtype=np.int64)
+        self.step_index = np.zeros(self.n, dtype=np.int64)
+        self.growable_frontier = np.zeros(self.n, dtype=np.int64)
+
+        self.reset(np.arange(self.n))
+
+        information = {
+            'step': self.step_index.copy(),
+            'score': self.score.copy(),
+            'frontier': self.growable_frontier.copy(),
+            'action_mask': self.action_mask(),
+            'final_step': np.zeros(self.n, dtype=np.int64),
+            'final_score': np.zeros(self.n, dtype=np.int64)}
+        return self.state(), np.zeros(self.n), np.zeros(self.n, dtype=bool), information
+
+    def reset(self, indices):
+        for n in indices:
+            r, c = self.r[n], self.c[n]
+            self.slices_map[n] = -1
+            self.growable_frontier[n] = initial_flags(self._can_increase[n], r, c)
+        self.cursor_position[indices] = 0
+        self.slice_mode[indices] = False
+        self.score[indices] = 0
+        self.step_index[indices] = 0
+
+    def state(self):
+        return {
+            'ingredients_map': self.ingredients_map,
+            'slices_map': self.slices_map.copy(),
+            'cursor_position': self.cursor_position.copy(),
+            'slice_mode': self.slice_mode.copy(),
+            'min_each_ingredient_per_slice': self.l,
+            'max_ingredients_per_slice': self.h,
+        }
+
+    def ingredients_of(self, indices, bounds):
+        '''
+        Return 2d array of number of ingredients inside bounds (r0, c0, r1, c1) of
+        a slice for each of the pizzas. Ingredients that are not on the pizza are
+        counted as infinitely many, so they never break the minimum.
+        '''
+
+        p = self._padded_from_origin
+        r0, c0, r1, c1 = bounds[:,0], bounds[:,1], bounds[:,2]+1, bounds[:,3]+1
+        ingredients = (
+            p[indices,r1,c1] - p[indices,r0,c1] - p[indices,r1,c0] + p[indices,r0,c0]).astype(np.int32)
+        return np.where(self._present[indices], ingredients, np.iinfo(np.int32).max)
+
+    def score_of(self, indices, bounds):
+        area = (bounds[:,2]-bounds[:,0]+1) * (bounds[:,3]-bounds[:,1]+1)
+        valid = self.ingredients_of(indices, bounds).min(axis=1) >= self.l[indices]
+        return np.where(valid, area, 0), valid
+
+    def move(self, indices, directions):
+        next_cursor_position = self.cursor_position[indices] + self.delta_position[directions]
+        inside = \
+            (next_cursor_position[:,0] >= 0) & (next_cursor_position[:,0] < self.r[indices]) & \
+            (next_cursor_position[:,1] >= 0) & (next_cursor_position[:,1] < self.c[indices])
+
+        self.cursor_position[indices[inside]] = next_cursor_position[inside]
+        return np.where(inside, NEUTRAL_REWARD, NEGATIVE_REWARD)
+
+    def increase(self, indices, directions):
+        rows, columns = self.cursor_position[indices,0], self.cursor_position[indices,1]
+        slice_ids = self.slices_map[indices,rows,columns]
+        in_slice = slice_ids != -1
+
+        r0 = np.where(in_slice, slice_ids // self.c[indices], rows)
+        c0 = np.where(in_slice, slice_ids % self.c[indices], columns)
+        corner = self._corner[indices,r0,c0]
+        r1 = np.where(in_slice, corner[:,0], rows)
+        c1 = np.where(in_slice, corner[:,1], columns)
+
+        bounds = np.stack([r0,c0,r1,c1], axis=1)
+        new_bounds = bounds + self.delta_increase_slice[directions]
+        new_area = (new_bounds[:,2]-new_bounds[:,0]+1) * (new_bounds[:,3]-new_bounds[:,1]+1)
+
+        increased = \
+            (self._can_increase[indices,r0,c0] >> directions & 1).astype(bool) & \
+            (new_area <= self.h[indices])
+        rewards = np.full(len(indices), NEGATIVE_REWARD)
+        if not np.any(increased):
+            return rewards
+
+        indices, bounds, new_bounds = \
+            indices[increased], bounds[increased], new_bounds[increased]
+        old_score, _ = self.score_of(indices, bounds)
+        new_score, valid = self.score_of(indices, new_bounds)
+
+        score = np.where(valid, new_score-old_score, 0)
+        self.score[indices] += score
+        rewards[increased] = np.where(valid, score * POSITIVE_REWARD, NEUTRAL_REWARD)
+
+        for n, slice in zip(indices, new_bounds):
+            self.cut(n, *slice)
+        return rewards
+
+    def cut(self, n, r0, c0, r1, c1):
+        self.slices_map[n, r0:r1+1, c0:c1+1] = r0*self.c[n]+c0
+        self._corner[n,r0,c0] = r1, c1
+        for direction in Direction:
+            self.disable_increase_around(n, r0, c0, r1, c1, direction)
+
+    def disable_increase_of(self, n, r0, c0, r1, c1, direction):
+        flags = self._can_increase[n, r0:r1+1, c0:c1+1]
+        cleared = flags & FLAG_BITS[direction]
+        self.growable_frontier[n] -= np.count_nonzero(cleared)
+        flags ^= cleared
+
+    def disable_increase_around(self, n, r0, c0, r1, c1, direction):
+        '''
+        Same as Pizza.disable_increase_around for the pizza with index n.
+        '''
+
+        side_r0, side_c0, side_r1, side_c1 = Slice.delta_side_fn[direction](r0,c0,r1,c1)
+
+        # if on the edge of the pizza
+        if side_r0 < 0 or side_c0 < 0 or side_r1 >= self.r[n] or side_c1 >= self.c[n]:
+            self.disable_increase_of(n, r0, c0, r1, c1, direction.value)
+            return
+
+        # if cannot increase anymore because of the max ingredients per slice
+        area = (r1-r0+1) * (c1-c0+1)
+        side_area = (side_r1-side_r0+1) * (side_c1-side_c0+1)
+        if area + side_area > self.h[n]:
+            self.disable_increase_of(n, r0, c0, r1, c1, direction.value)
+
+        # disable for all side slices
+        side_increase_direction = OPPOSITE[direction.value]
+        side_slice_ids = np.unique(self.slices_map[n, side_r0:side_r1+1, side_c0:side_c1+1])
+        side_slice_ids = side_slice_ids[side_slice_ids != -1]
+        for slice_id in side_slice_ids:
+            slice_r0, slice_c0 = divmod(slice_id, self.c[n])
+            slice_r1, slice_c1 = self._corner[n,slice_r0,slice_c0]
+            self.disable_increase_of(n, slice_r0, slice_c0, slice_r1, slice_c1,
+                side_increase_direction)
+        self.disable_increase_of(n, side_r0, side_c0, side_r1, side_c1, side_increase_direction)
+
+        # disable for slice if there are slices on the side
+        if len(side_slice_ids) > 0:
+            self.disable_increase_of(n, r0, c0, r1, c1, direction.value)
+
+    def action_mask(self):
+        '''
+        Return 2d boolean array with a row of GoogleEngineer.action_mask for each
+        of the pizzas.
+        '''
+
+        indices = np.arange(self.n)
+        rows, columns = self.cursor_position[:,0], self.cursor_position[:,1]
+        slice_ids = self.slices_map[indices,rows,columns]
+        in_slice = slice_ids != -1
+
+        r0 = np.where(in_slice, slice_ids // self.c, rows)
+        c0 = np.where(in_slice, slice_ids % self.c, columns)
+        corner = self._corner[indices,r0,c0]
+        height = np.where(in_slice, corner[:,0]-r0+1, 1)
+        width = np.where(in_slice, corner[:,1]-c0+1, 1)
+
+        # increasing right or left adds a column, down or up adds a row
+        area = height * width
+        increase = UNPACK_FLAGS[self._can_increase[indices,r0,c0]]
+        increase[:,[Direction.right.value, Direction.left.value]] &= (area + height <= self.h)[:,None]
+        increase[:,[Direction.down.value, Direction.up.value]] &= (area + width <= self.h)[:,None]
+
+        next_cursor_position = self.cursor_position[:,None] + self.delta_position
+        move = \
+            (next_cursor_position[:,:,0] >= 0) & (next_cursor_position[:,:,0] < self.r[:,None]) & \
+            (next_cursor_position[:,:,1] >= 0) & (next_cursor_position[:,:,1] < self.c[:,None])
+
+        mask = np.ones((self.n,len(ACTIONS)), dtype=bool)
+        mask[:,:4] = np.where(self.slice_mode[:,None], increase, move)
+        return mask
+
+    def memory(self):
+        '''
+        Return bytes of the arrays of one pizza by their names, like Pizza.memory.
+        '''
+
+        return {
+            'slices_map': self.slices_map[0].nbytes,
+            'can_increase': self._can_increase[0].nbytes,
+            'corners': self._corner[0].nbytes,
+            'ingredients_map': self.ingredients_map[0].nbytes,
+            'ingredients_prefix_sums': self._padded_from_origin[0].nbytes,
+        }
+
+    def step(self, actions):
+        actions = np.asarray(actions)
+        if actions.dtype.kind in 'USO':
+            if not set(actions.tolist()) <= set(ACTIONS):
+                raise ActionNotFoundException('Actions {} are not recognised.'.format(
+                    sorted(set(actions.tolist()) - set(ACTIONS))))
+            actions = np.array([ACTIONS.index(action) for action in actions.tolist()])
+        elif np.any((actions < 0) | (actions >= len(ACTIONS))):
+            raise ActionNotFoundException('Actions {} are not recognised.'.format(
+                np.unique(actions[(actions < 0) | (actions >= len(ACTIONS))]).tolist()))
+
+        self.step_index += 1
+        rewards = np.full(self.n, NEUTRAL_REWARD)
+
+        toggle = actions == TOGGLE
+        increase = ~toggle & self.slice_mode
+        move = ~toggle & ~self.slice_mode
+
+        self.slice_mode[toggle] = ~self.slice_mode[toggle]
+        indices = np.flatnonzero(move)
+        rewards[indices] = self.move(indices, actions[indices])
+        indices = np.flatnonzero(increase)
+        rewards[indices] = self.increase(indices, actions[indices])
+
+        done = (self.growable_frontier == 0) | (self.step_index >= self.max_steps)
+
+        information = {
+            'step': self.step_index.copy(),
+            'score': self.score.copy(),
+            'frontier': self.growable_frontier.copy(),
+            'final_step': np.where(done, self.step_index, 0),
+            'final_score': np.where(done, self.score, 0)}
+        self.reset(np.flatnonzero(done))
+        # the mask is for the next action, so it is taken after the reset
+        information['action_mask'] = self.action_mask()
+        return self.state(), rewards, done, information
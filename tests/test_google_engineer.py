@@ -0,0 +1,28 @@
+import copy
+import pickle
+import random
+
+from src.google_engineer import GoogleEngineer, ACTIONS
+
+def random_config(rnd):
+    r, c = rnd.randint(2, 10), rnd.randint(2, 10)
+    return {
+        'pizza_lines': [''.join(rnd.choice('TM') for _ in range(c)) for _ in range(r)],
+        'r': r, 'c': c, 'l': 1, 'h': rnd.randint(2, 12),
+    }
+
+def play(engineer, actions):
+    return [engineer.do(action) for action in actions]
+
+def test_copies_play_on_like_the_original():
+    rnd = random.Random(3)
+    for _ in range(20):
+        engineer = GoogleEngineer(random_config(rnd))
+        play(engineer, [rnd.choice(ACTIONS) for _ in range(300)])
+        copies = [copy.deepcopy(engineer), pickle.loads(pickle.dumps(engineer))]
+        actions = [rnd.choice(ACTIONS) for _ in range(300)]
+        expected = play(engineer, actions)
+        for engineer_copy in copies:
+            assert play(engineer_copy, actions) == expected
+            assert (engineer_copy.pizza._map == engineer.pizza._map).all()
+            assert engineer_copy.score == engineer.score
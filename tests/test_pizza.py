@@ -0,0 +1,28 @@
+import random
+
+from src.google_engineer import GoogleEngineer, ACTIONS
+
+def random_boards(rnd, boards):
+    for _ in range(boards):
+        r, c = rnd.randint(1, 12), rnd.randint(1, 12)
+        engineer = GoogleEngineer({
+            'pizza_lines': [''.join(rnd.choice('TM') for _ in range(c)) for _ in range(r)],
+            'r': r, 'c': c, 'l': rnd.randint(0, 2), 'h': rnd.randint(1, 16),
+        })
+        for _ in range(rnd.randint(0, 2000)):
+            engineer.do(rnd.choice(ACTIONS if rnd.random() < 0.5 else ['toggle', 'right', 'down']))
+        yield engineer.pizza
+
+def test_side_slice_ids_are_slice_ids_in_strip():
+    rnd = random.Random(20)
+    for pizza in random_boards(rnd, 200):
+        for _ in range(50):
+            row, c0 = rnd.randrange(pizza.r), rnd.randrange(pizza.c)
+            c1 = rnd.randrange(c0, pizza.c)
+            assert sorted(pizza._side_slice_ids(row, c0, row, c1)) == \
+                sorted(int(slice_id) for slice_id in pizza._slice_ids_in(row, c0, row, c1))
+
+            column, r0 = rnd.randrange(pizza.c), rnd.randrange(pizza.r)
+            r1 = rnd.randrange(r0, pizza.r)
+            assert sorted(pizza._side_slice_ids(r0, column, r1, column)) == \
+                sorted(int(slice_id) for slice_id in pizza._slice_ids_in(r0, column, r1, column))
@@ -0,0 +1,50 @@
+import random
+
+import numpy as np
+
+from src.google_engineer import GoogleEngineer, ACTIONS
+from src.pizza import UNPACK_FLAGS
+from src.vector_game import VectorGame
+
+def random_configs(rnd, n):
+    configs = []
+    for _ in range(n):
+        r, c = rnd.randint(1, 12), rnd.randint(1, 12)
+        # some pizzas have only one ingredient, so the other one is padding
+        ingredients = rnd.choice(['TM', 'TM', 'T'])
+        configs.append({
+            'pizza_lines': [''.join(rnd.choice(ingredients) for _ in range(c)) for _ in range(r)],
+            'r': r, 'c': c, 'l': rnd.randint(0, 2), 'h': rnd.randint(1, 14),
+        })
+    return configs
+
+def test_steps_match_google_engineer():
+    rnd = random.Random(2)
+    configs = random_configs(rnd, 40)
+    max_steps = 300
+    vector_game = VectorGame({'max_steps': max_steps})
+    vector_game.init(configs)
+    engineers = [GoogleEngineer(config) for config in configs]
+    steps = [0] * len(configs)
+
+    random_state = np.random.RandomState(2)
+    for _ in range(1500):
+        actions = random_state.choice(len(ACTIONS), len(configs), p=[.21, .21, .21, .21, .16])
+        state, rewards, done, information = vector_game.step(actions)
+        for n, engineer in enumerate(engineers):
+            reward = engineer.do(ACTIONS[actions[n]])
+            steps[n] += 1
+            assert rewards[n] == reward
+            assert done[n] == ((not engineer.pizza.can_increase_more()) or steps[n] >= max_steps)
+            assert information['score'][n] == engineer.score
+            if done[n]:
+                engineer = engineers[n] = GoogleEngineer(configs[n])
+                steps[n] = 0
+
+            r, c = vector_game.r[n], vector_game.c[n]
+            assert (state['slices_map'][n,:r,:c] == engineer.pizza._map).all()
+            assert tuple(state['cursor_position'][n]) == engineer.cursor_position
+            assert state['slice_mode'][n] == engineer.slice_mode
+            assert (UNPACK_FLAGS[vector_game._can_increase[n,:r,:c]] ==
+                engineer.pizza.can_increase_map()).all()
+            assert (information['action_mask'][n] == engineer.action_mask()).all()